@@ -0,0 +1,336 @@
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from metadata import create_metadata
+from raven import Site, find_root
+
+# -------------------------------------------------------------------
+# Benchmarks
+#
+#   python3 benchmark.py --sizes 100 10000 --output bench.json
+#   python3 benchmark.py --sizes 1000 --serve --requests 5000
+#
+# For each size a synthetic site is generated in a temp folder, in the
+# same layout as a real one (Drafts, Articles-Metadata, Config, Images,
+# and a copy of Scripts so server.py can serve it). Drafts have headings,
+# paragraphs, links, code blocks, images and tags. Then each build stage
+# is timed in-process (wall and CPU seconds):
+#
+#   metadata   allocating --allocations new article numbers on top of the archive
+#   cold       full update.py article build from scratch
+#   warm       the same build again, nothing changed
+#   touch      one draft edited
+#   feeds      feeds.py, cold and warm
+#   homepage   homepage.py, cold and warm
+#
+# --serve starts server.py on the generated site and load-tests
+# SecureHandler over HTTPS keep-alive connections with a mix of pages,
+# .text, images, feeds and 404s.
+#
+# Results are written as JSON, so runs from two versions can be diffed.
+# -------------------------------------------------------------------
+WORDS = ("raven feather lorem ipsum dolor sit amet python markdown build cache page "
+         "article server image code render index archive tree forest night wing").split()
+LANGUAGES = ["python", "javascript", "c", "bash", ""]
+TAGS = ["python", "web", "performance", "notes", "design", "tools"]
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def code_block(rng):
+    language = rng.choice(LANGUAGES)
+    lines = [f"def f{i}(x):\n    return x * {i}  # {rng.choice(WORDS)}" for i in range(rng.randint(3, 12))]
+    return f"```{language}\n" + "\n".join(lines) + "\n```"
+
+
+def synthetic_draft(rng, number, images):
+    parts = [f"# Article {number}", ""]
+    if images:
+        image = rng.choice(images)
+        parts.append(f"<thumbnail:Images/{image}|Synthetic image {number}>")
+    for section in range(rng.randint(2, 6)):
+        parts += ["", f"## Section {section + 1}", ""]
+        for _ in range(rng.randint(1, 4)):
+            text = " ".join(sentence(rng) for _ in range(rng.randint(2, 6)))
+            if rng.random() < 0.5:
+                text += f" See [article {max(1, number - 1)}](/article-{max(1, number - 1)}) or [Python](https://python.org)."
+            parts += [text, ""]
+        if rng.random() < 0.6:
+            parts += [code_block(rng), ""]
+        if images and rng.random() < 0.3:
+            parts += [f"![Figure {section}](Images/{rng.choice(images)})", ""]
+    return "\n".join(parts) + "\n"
+
+
+def generate_site(dest, count, seed=0):
+    """Create a synthetic site with count drafts (plus metadata) in dest."""
+    rng = random.Random(seed)
+    source = find_root()
+    for name in ["Config", "Images", "Scripts"]:
+        shutil.copytree(os.path.join(source, name), os.path.join(dest, name),
+                        ignore=shutil.ignore_patterns("__pycache__", "*.pem"))
+    for name in ["Drafts", "Articles-Metadata", "Articles-html", "Articles-md", "Unpublished"]:
+        os.makedirs(os.path.join(dest, name), exist_ok=True)
+
+    images = sorted(f for f in os.listdir(os.path.join(dest, "Images")) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    start = datetime(2020, 1, 1)
+    for number in range(1, count + 1):
+        slug = f"article-{number}"
+        with open(os.path.join(dest, "Drafts", slug + ".md"), "w", encoding="utf-8") as f:
+            f.write(synthetic_draft(rng, number, images))
+        metadata = {
+            "article_number": number,
+            "title": slug,
+            "date_created": (start + timedelta(hours=6 * number)).isoformat(),
+            "thumbnail": f"Images/{images[number % len(images)]}" if images else "",
+            "thumbnailAltText": f"Synthetic image {number}",
+            "tags": rng.sample(TAGS, 2),
+        }
+        with open(os.path.join(dest, "Articles-Metadata", slug + ".json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=4)
+
+
+@contextlib.contextmanager
+def timed(results, name):
+    """Record wall and CPU seconds for a stage; build output is swallowed."""
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+    results[name] = {
+        "wall_s": round(time.perf_counter() - wall, 4),
+        "cpu_s": round(time.process_time() - cpu, 4),
+    }
+    print(f"  {name:<16} {results[name]['wall_s']:>9.3f}s wall {results[name]['cpu_s']:>9.3f}s cpu")
+
+
+def bench_build(site_dir, workers, allocations):
+    site = Site(site_dir)
+    stages = {}
+
+    # Allocation on top of an existing archive, as publish.py does it
+    names = []
+    for i in range(allocations):
+        name = f"new-{i}.md"
+        with open(os.path.join(site.drafts_dir, name), "w", encoding="utf-8") as f:
+            f.write(f"# New {i}\n\nFresh post.\n")
+        names.append(name)
+    with timed(stages, "metadata"):
+        for name in names:
+            create_metadata(site, name)
+    if allocations:
+        stages["metadata"]["per_allocation_ms"] = round(stages["metadata"]["wall_s"] * 1000 / allocations, 3)
+
+    with timed(stages, "cold"):
+        site.build_articles(workers=workers)
+    with timed(stages, "warm"):
+        site.build_articles(workers=workers)
+
+    with open(os.path.join(site.drafts_dir, "article-1.md"), "a", encoding="utf-8") as f:
+        f.write("\nOne more line.\n")
+    with timed(stages, "touch"):
+        site.build_articles(workers=workers)
+
+    with timed(stages, "feeds_cold"):
+        site.build_feeds()
+    with timed(stages, "feeds_warm"):
+        site.build_feeds()
+    with timed(stages, "homepage_cold"):
+        site.build_homepage()
+    with timed(stages, "homepage_warm"):
+        site.build_homepage()
+    return stages
+
+
+# -------------------------------------------------------------------
+# Serving
+# -------------------------------------------------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def bench_serve(site_dir, count, requests, concurrency, seed=0):
+    config_path = os.path.join(site_dir, "Config", "server.json")
+    with open(config_path, "r", encoding="utf-8") as f:
+        server_config = json.load(f)
+    https_port = free_port()
+    server_config.update(host="127.0.0.1", http_port=free_port(), https_port=https_port, live_reload=False)
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(server_config, f, indent=4)
+
+    server = subprocess.Popen([sys.executable, os.path.join(site_dir, "Scripts", "server.py")],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(https_port):
+            raise RuntimeError("server.py did not start")
+
+        rng = random.Random(seed)
+        images = sorted(os.listdir(os.path.join(site_dir, "Articles-html", "Images")))
+        mix = []
+        for _ in range(requests):
+            roll = rng.random()
+            number = rng.randint(1, count)
+            if roll < 0.6:
+                mix.append(("page", f"/article-{number}"))
+            elif roll < 0.7:
+                mix.append(("text", f"/article-{number}.text"))
+            elif roll < 0.85 and images:
+                mix.append(("image", f"/Images/{rng.choice(images)}"))
+            elif roll < 0.95:
+                mix.append(("feed", "/rss.xml"))
+            else:
+                mix.append(("404", f"/missing-{number}"))
+
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        latencies = {}
+        statuses = {}
+        errors = 0
+        lock = threading.Lock()
+        chunks = [mix[i::concurrency] for i in range(concurrency)]
+
+        def client(chunk):
+            nonlocal errors
+            conn = http.client.HTTPSConnection("127.0.0.1", https_port, context=context, timeout=30)
+            for kind, path in chunk:
+                started = time.perf_counter()
+                try:
+                    conn.request("GET", path, headers={"Accept-Encoding": "gzip, br"})
+                    response = conn.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPSConnection("127.0.0.1", https_port, context=context, timeout=30)
+                    with lock:
+                        errors += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.setdefault(kind, []).append(elapsed)
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+            conn.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(chunk,)) for chunk in chunks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 4),
+        "requests_per_s": round(requests / wall, 1) if wall else None,
+        "errors": errors,
+        "statuses": statuses,
+        "latency_ms": {},
+    }
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        result["latency_ms"][kind] = {
+            "count": len(values),
+            "p50": round(percentile(values, 0.50) * 1000, 3),
+            "p90": round(percentile(values, 0.90) * 1000, 3),
+            "p99": round(percentile(values, 0.99) * 1000, 3),
+            "max": round(values[-1] * 1000, 3),
+        }
+    print(f"  serve            {result['requests_per_s']} req/s, {errors} error(s)")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the build stages (and optionally the server) on synthetic sites.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100], help="draft counts to benchmark (default 100)")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="render processes for the article build")
+    parser.add_argument("--allocations", type=int, default=100, help="article numbers to allocate in the metadata stage")
+    parser.add_argument("--serve", action="store_true", help="also load-test server.py (needs openssl)")
+    parser.add_argument("--requests", type=int, default=2000, help="requests for the load test")
+    parser.add_argument("--concurrency", type=int, default=8, help="client connections for the load test")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the generated sites")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": args.workers,
+        "sizes": {},
+    }
+    for count in args.sizes:
+        site_dir = tempfile.mkdtemp(prefix=f"raven-bench-{count}-")
+        try:
+            print(f"{count} drafts ({site_dir})")
+            started = time.perf_counter()
+            generate_site(site_dir, count, args.seed)
+            entry = {"generate_s": round(time.perf_counter() - started, 4)}
+            entry["stages"] = bench_build(site_dir, args.workers, args.allocations)
+            if args.serve:
+                entry["serve"] = bench_serve(site_dir, count, args.requests, args.concurrency, args.seed)
+            results["sizes"][str(count)] = entry
+        finally:
+            if not args.keep:
+                shutil.rmtree(site_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# -------------------------------------------------------------------
+# Precompressed siblings
+#
+# Compressible outputs get foo.html.gz (and foo.html.br when the brotli
+# package is installed) written next to them at build time, so
+# server.py can pick one from Accept-Encoding without compressing per
+# request.
+# -------------------------------------------------------------------
+COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".xml", ".txt", ".md", ".js", ".json", ".svg"}
+
+# Served encodings in order of preference, with their file suffixes
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def is_compressible(path):
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+def compressed_siblings(path):
+    """Every sibling path compress_file may write for path."""
+    return [path + suffix for _, suffix in ENCODINGS]
+
+
+def _write_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def compress_file(path):
+    """Write .gz/.br siblings for path. Returns the sibling paths written."""
+    if not is_compressible(path) or not os.path.isfile(path):
+        return []
+    with open(path, "rb") as f:
+        data = f.read()
+
+    written = []
+    # mtime=0 keeps the .gz bytes identical for identical input
+    _write_atomic(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(path + ".gz")
+    if brotli is not None:
+        _write_atomic(path + ".br", brotli.compress(data, quality=11))
+        written.append(path + ".br")
+    elif os.path.exists(path + ".br"):
+        # brotli was uninstalled since the last build; don't leave a stale copy
+        os.remove(path + ".br")
+    return written
+
+
+def remove_compressed(path):
+    for sibling in compressed_siblings(path):
+        if os.path.exists(sibling):
+            os.remove(sibling)
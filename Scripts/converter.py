@@ -0,0 +1,194 @@
+import json
+from collections import OrderedDict
+
+import markdown
+from markdown.extensions import Extension
+from markdown.extensions.attr_list import get_attrs_and_remainder
+from markdown.extensions.codehilite import CodeHilite, HiliteTreeprocessor, parse_hl_lines
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from timing import stage
+
+try:
+    from pygments.formatters import HtmlFormatter
+except ImportError:
+    HtmlFormatter = None
+
+# -------------------------------------------------------------------
+# Shared Markdown converter
+#
+# Building a markdown.Markdown instance sets up every extension and
+# processor, so one instance is kept per process (and per highlight
+# settings) and reset() between documents instead of calling
+# markdown.markdown() each time.
+# -------------------------------------------------------------------
+EXTENSIONS = ['extra', 'smarty', 'toc', 'sane_lists', 'md_in_html']
+EXTENSION_CONFIGS = {
+    'smarty': {'smart_quotes': True, 'smart_dashes': True, 'smart_ellipses': True},
+}
+
+# -------------------------------------------------------------------
+# Code highlighting (Config/highlight.json overrides these defaults)
+#
+# With "classes" on, Pygments marks tokens with CSS classes and the
+# build writes one stylesheet for the chosen style (HIGHLIGHT_CSS_NAME)
+# instead of repeating a style= attribute on every token. "guess_lang"
+# lets Pygments try every lexer on code blocks without a language,
+# which is slow; off, they are rendered as plain text.
+# -------------------------------------------------------------------
+HIGHLIGHT_DEFAULTS = {
+    "style": "monokai",
+    "classes": True,
+    "linenums": True,
+    "guess_lang": True,
+    "cache_entries": 2048,  # highlighted blocks kept per process
+}
+HIGHLIGHT_CSS_NAME = "pygments.css"
+CSS_CLASS = "codehilite"
+
+_converters = {}
+
+
+def codehilite_config(highlight):
+    return {
+        'guess_lang': bool(highlight["guess_lang"]),
+        'linenums': bool(highlight["linenums"]),
+        'pygments_style': highlight["style"],
+        'noclasses': not highlight["classes"],
+        'css_class': CSS_CLASS,
+    }
+
+
+def uses_stylesheet(highlight):
+    return bool(highlight["classes"]) and HtmlFormatter is not None
+
+
+def highlight_css(highlight):
+    """Stylesheet for class-based highlighting, or None when it isn't used (or Pygments is missing)."""
+    if not uses_stylesheet(highlight):
+        return None
+    return HtmlFormatter(style=highlight["style"]).get_style_defs("." + CSS_CLASS) + "\n"
+
+
+def highlight_css_link(highlight, href=HIGHLIGHT_CSS_NAME):
+    return f'<link rel="stylesheet" href="{href}">' if uses_stylesheet(highlight) else ""
+
+# -------------------------------------------------------------------
+# Highlighting extension
+#
+# Does what codehilite does for indented and fenced code blocks, but
+# through a cache of highlighted blocks keyed by (code, language and
+# block options): the same snippet in several articles, or an article
+# re-rendered by watch.py, is highlighted (and its language guessed)
+# once per converter.
+# -------------------------------------------------------------------
+class HighlightTreeprocessor(HiliteTreeprocessor):
+    """Indented code blocks (and their :::lang / #! headers)."""
+
+    def __init__(self, md, highlighter):
+        super().__init__(md)
+        self.highlighter = highlighter
+
+    def run(self, root):
+        for block in root.iter('pre'):
+            if len(block) == 1 and block[0].tag == 'code' and block[0].text is not None:
+                code = self.highlighter.hilite(self.code_unescape(block[0].text), None, shebang=True)
+                block.clear()
+                # Becomes a placeholder paragraph, replaced by the stashed HTML at the end
+                block.tag = 'p'
+                block.text = self.md.htmlStash.store(code)
+
+
+class FencedHighlighter(FencedBlockPreprocessor):
+    """fenced_code's block parsing, highlighting through the extension's cache."""
+
+    def __init__(self, md, config, highlighter):
+        super().__init__(md, config)
+        self.highlighter = highlighter
+
+    def run(self, lines):
+        text = "\n".join(lines)
+        index = 0
+        while True:
+            m = self.FENCED_BLOCK_RE.search(text, index)
+            if m is None:
+                break
+            lang, classes, config = None, [], {}
+            if m.group('attrs'):
+                attrs, remainder = get_attrs_and_remainder(m.group('attrs'))
+                if remainder:
+                    # Unbalanced braces: not a fence opener
+                    index = m.end('attrs')
+                    continue
+                _, classes, config = self.handle_attrs(attrs)
+                if classes:
+                    lang = classes.pop(0)
+            else:
+                lang = m.group('lang') or None
+                if m.group('hl_lines'):
+                    config['hl_lines'] = parse_hl_lines(m.group('hl_lines'))
+
+            if config.get('use_pygments', True):
+                placeholder = self.md.htmlStash.store(
+                    self.highlighter.hilite(m.group('code'), lang, False, classes, config))
+            else:
+                # {use_pygments=false}: fenced_code's own plain <pre><code> block
+                placeholder = "\n".join(super().run(m.group(0).split("\n"))).strip("\n")
+            text = f"{text[:m.start()]}\n{placeholder}\n{text[m.end():]}"
+            index = m.start() + 1 + len(placeholder)
+        return text.split("\n")
+
+
+class HighlightExtension(Extension):
+    """codehilite with a bounded cache of highlighted blocks per converter."""
+
+    def __init__(self, highlight):
+        super().__init__()
+        self.options = codehilite_config(highlight)
+        self.max_entries = int(highlight["cache_entries"])
+        self.cache = OrderedDict()
+
+    def extendMarkdown(self, md):
+        # Takes over the fenced_code preprocessor that 'extra' registered
+        md.preprocessors.register(FencedHighlighter(md, {'lang_prefix': 'language-'}, self), 'fenced_code_block', 25)
+        md.treeprocessors.register(HighlightTreeprocessor(md, self), 'hilite', 30)
+        md.registerExtension(self)
+
+    def hilite(self, src, lang, shebang, classes=(), block_options=None):
+        """HTML for one code block, from the cache when it has been highlighted before."""
+        key = (src, lang, shebang, tuple(classes), json.dumps(block_options or {}, sort_keys=True))
+        code = self.cache.get(key)
+        if code is not None:
+            self.cache.move_to_end(key)
+            return code
+        options = dict(self.options, **(block_options or {}))
+        # Extra classes go first: Pygments may append a suffix to the last one
+        options['css_class'] = " ".join(list(classes) + [options['css_class']])
+        # Pygments time (language guessing included) is its own stage in build timings (--timings)
+        with stage("highlight"):
+            code = CodeHilite(src, lang=lang, style=options.pop('pygments_style'), **options).hilite(shebang)
+        if self.max_entries > 0:
+            self.cache[key] = code
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return code
+
+
+def get_converter(highlight=None):
+    """Return this process's Markdown instance for these highlight settings, creating it on first use."""
+    highlight = dict(HIGHLIGHT_DEFAULTS, **(highlight or {}))
+    key = json.dumps(highlight, sort_keys=True)
+    md = _converters.get(key)
+    if md is None:
+        md = _converters[key] = markdown.Markdown(
+            extensions=EXTENSIONS + [HighlightExtension(highlight)],
+            extension_configs=EXTENSION_CONFIGS,
+            output_format="html5"
+        )
+    return md
+
+
+def convert(text, highlight=None):
+    """Convert one Markdown document to HTML."""
+    md = get_converter(highlight)
+    md.reset()
+    return md.convert(text)
@@ -1,123 +1,354 @@
 import os
+import re
 import json
+import urllib.parse
+from datetime import datetime
+from html.parser import HTMLParser
+from feedgen.feed import FeedGenerator
+from feedgen.ext.base import BaseExtension
+from compress import compress_file, remove_compressed
+from manifest import bump_generation, hash_bytes, hash_file, load_manifest, save_manifest
+from metaindex import load_index
+from navigation import build_navigation
 
-#Find Base Dir
-base_dir = os.path.dirname(os.path.abspath(__file__))
-current = base_dir
-root_dir = None
-while current != os.path.dirname(current):
-    if os.path.basename(current) == "Raven":
-        root_dir = current
-        break
-    current = os.path.dirname(current)
-if root_dir is None:
-    raise FileNotFoundError("Could not find 'Raven' folder in parent directories.")
-
-#Find other folders
-articles_md_dir = os.path.join(root_dir, "Articles-md")
-articles_html_dir = os.path.join(root_dir, "Articles-html")
-metadata_dir = os.path.join(root_dir, "Articles-Metadata")
-config_dir = os.path.join(root_dir, "Config")
-
-#Delete old feeds
-rss_path = os.path.join(articles_html_dir, "rss.xml")
-atom_path = os.path.join(articles_html_dir, "atom.xml")
-
-for feed_file in [rss_path, atom_path]:
-    if os.path.exists(feed_file):
-        os.remove(feed_file)
-        
-#Find feeds.json
-config = os.path.join(config_dir, "feeds.json")
-
-#Create Variables
-siteURL = ""
-siteName = ""
-rss = ""
-atom = ""
-i = 0
-feedType = ""
-
-#Set Variables
-with open(config, "r") as f:
-    feed_data = json.load(f)
-
-for key, value in feed_data.items():
-    globals()[key] = value
-
-if rss == 1:
-    feedType = "rss "
-if atom == 1:
-    if feedType == "rss ":
-        feedType = "rss & atom "
-    else:
-        feedType = "atom "
-
-if feedType == "rss & atom ":
-    feedType = feedType + "feeds"
-else:
-    feedType = feedType + "feed"
+# Config/feeds.json, with these defaults for missing keys
+FEED_DEFAULTS = {
+    "siteURL": "",
+    "siteName": "",
+    "rss": 0,
+    "atom": 0,
+    "maxItems": 20,
+    "contentMode": "none",  # "full", "summary" or "none"
+    "summaryLength": 300,
+    "tagFeeds": 0,
+    "archivePages": 0,
+}
 
-from feedgen.feed import FeedGenerator
-fg = FeedGenerator()
-fg.id('https://' + siteURL + "/feed")
-fg.title(siteName + 'Feed')
-fg.author({'name':siteName})
-fg.link(href='https://' + siteURL, rel='alternate')
-fg.logo('http://' + siteURL + "/Images/logo.png")
-fg.language('en')
-fg.description(siteName + " " + feedType)
-
-def addFeed(file):
-    global i
-    fe = fg.add_entry()
-    fe.id('https://' + siteURL + "/feed" + "/" + str(i))
-    fe.title(file)
-    fe.link(href="https://" + siteURL + "/" + file + ".html")
-    i += 1
+def parse_date(date_created_iso):
+    """Metadata dates are naive local time; feeds need an aware datetime."""
+    if not date_created_iso:
+        return None
+    try:
+        return datetime.fromisoformat(date_created_iso).astimezone()
+    except ValueError:
+        return None
 
 # ---------------------------------------------------------
-# NEW SECTION: load metadata, filter, and sort by article_number
+# Entry content, taken from the bodies update.py already rendered
 # ---------------------------------------------------------
 
-articles = []  # (article_number, article_slug)
+URL_ATTR = re.compile(r'\b(href|src|srcset)="([^"]*)"')
+
+def absolutize(html, page_url):
+    """Resolve relative links and image URLs against the article's URL, for feed readers."""
+    def resolve(url):
+        return urllib.parse.urljoin(page_url, url)
 
-for filename in os.listdir(metadata_dir):
-    if not filename.endswith(".json"):
-        continue
+    def replace(match):
+        attr, value = match.groups()
+        if attr == "srcset":
+            candidates = []
+            for candidate in value.split(","):
+                parts = candidate.strip().split(" ", 1)
+                parts[0] = resolve(parts[0])
+                candidates.append(" ".join(parts))
+            value = ", ".join(candidates)
+        else:
+            value = resolve(value)
+        return f'{attr}="{value}"'
 
-    meta_path = os.path.join(metadata_dir, filename)
+    return URL_ATTR.sub(replace, html)
 
-    with open(meta_path, "r", encoding="utf-8") as m:
-        data = json.load(m)
+class TextExtractor(HTMLParser):
+    """Collect visible text, stopping once enough has been seen."""
 
-    # Skip non-article metadata
-    if data.get("not-article") is True:
-        continue
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self.parts = []
+        self.length = 0
+        self.skip = 0
 
-    article_number = data.get("article_number")
-    if article_number is None:
-        continue
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self.skip += 1
 
-    article_slug = os.path.splitext(filename)[0]  # corresponds to markdown/html filename
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self.skip:
+            self.skip -= 1
 
-    # Verify article exists in markdown
-    md_path = os.path.join(articles_md_dir, article_slug + ".md")
-    if not os.path.exists(md_path):
-        continue
+    def handle_data(self, data):
+        if self.skip or self.length > self.limit:
+            return
+        self.parts.append(data)
+        self.length += len(data)
 
-    articles.append((article_number, article_slug))
+def summarize(html, limit):
+    extractor = TextExtractor(limit)
+    extractor.feed(html)
+    text = " ".join(" ".join(extractor.parts).split())
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip() + "…"
 
-# Sort newest first
-articles.sort(key=lambda x: x[0], reverse=True)
+def fragment_path(site, slug):
+    return os.path.join(site.fragments_dir, slug + ".html")
 
-# Add to feed in order
-for _, slug in articles:
-    addFeed(slug)
+def load_fragment(site, slug):
+    path = fragment_path(site, slug)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
 
 # ---------------------------------------------------------
+# RFC 5005 feed history: fh:archive marker and archive links in RSS
+# ---------------------------------------------------------
+
+FH_NS = "http://purl.org/syndication/history/1.0"
+ATOM_NS = "http://www.w3.org/2005/Atom"
+
+class HistoryExtension(BaseExtension):
+    def __init__(self):
+        self.archive = False
+        self.links = []  # (rel, href)
+
+    def extend_ns(self):
+        return {"fh": FH_NS}
+
+    def extend_atom(self, feed):
+        if self.archive:
+            feed.insert(0, feed.makeelement("{%s}archive" % FH_NS, {}))
+        return feed
+
+    def extend_rss(self, feed):
+        # feedgen only writes rel="self" atom:links into RSS
+        channel = feed.find("channel")
+        for rel, href in self.links:
+            channel.append(channel.makeelement("{%s}link" % ATOM_NS, {"rel": rel, "href": href}))
+        if self.archive:
+            channel.append(channel.makeelement("{%s}archive" % FH_NS, {}))
+        return feed
+
+# ---------------------------------------------------------
+# Build
+# ---------------------------------------------------------
+
+def build_feeds(site):
+    """Write the subscription, archive and tag feeds that changed. Returns the number of files updated."""
+    cfg = site.feed_config
+    siteURL = cfg["siteURL"]
+    siteName = cfg["siteName"]
+    rss = cfg["rss"]
+    atom = cfg["atom"]
+    maxItems = cfg["maxItems"]
+    contentMode = cfg["contentMode"]
+    summaryLength = cfg["summaryLength"]
+    tagFeeds = cfg["tagFeeds"]
+    archivePages = cfg["archivePages"]
+
+    feedType = ""
+    if rss == 1:
+        feedType = "rss "
+    if atom == 1:
+        if feedType == "rss ":
+            feedType = "rss & atom "
+        else:
+            feedType = "atom "
+
+    if feedType == "rss & atom ":
+        feedType = feedType + "feeds"
+    else:
+        feedType = feedType + "feed"
+
+    site_root = 'https://' + siteURL
+
+    #Feed outputs
+    rss_path = os.path.join(site.articles_html_dir, "rss.xml")
+    atom_path = os.path.join(site.articles_html_dir, "atom.xml")
+    feeds_dir = os.path.join(site.articles_html_dir, "feeds")
+
+    # Walk articles newest first. Without tag feeds or archives only the
+    # newest maxItems are needed, so the walk stops as soon as the feed is full.
+    metadata_index = load_index(site.root_dir)
+    navigation = build_navigation(metadata_index)
+    manifest = load_manifest(site.manifest_path)
+    need_all = tagFeeds == 1 or archivePages == 1
+
+    entries = []  # newest first
+
+    for article_slug in reversed(navigation["order"]):  # slug corresponds to markdown/html filename
+        if len(entries) >= maxItems and not need_all:
+            break
+
+        meta = metadata_index[article_slug]
+
+        # Skip non-article metadata
+        if meta.get("not-article") is True:
+            continue
+
+        # Verify article exists in markdown
+        md_path = os.path.join(site.articles_md_dir, article_slug + ".md")
+        if not os.path.exists(md_path):
+            continue
+
+        entry = {
+            "slug": article_slug,
+            "id": site_root + "/feed/" + str(meta["article_number"]),
+            "title": article_slug,
+            "link": site_root + "/" + article_slug + ".html",
+            "published": meta.get("date_created"),
+            "updated": meta.get("date_updated") or meta.get("date_created"),
+            "tags": list(meta.get("tags") or []),
+        }
+        if contentMode != "none":
+            # Entries embed the rendered body, so its bytes are part of the feed signature
+            entry["revision"] = hash_file(fragment_path(site, article_slug))
+        entries.append(entry)
+
+    # Writing feeds, skipping any whose entries and settings are unchanged
+    feed_state = manifest.get("feeds")
+    if not isinstance(feed_state, dict):
+        feed_state = {}
+    written_paths = set()
+    written = 0
+
+    def publish(path, kind, feed_entries, feed_id, title, links=(), is_archive=False):
+        nonlocal written
+        rel = os.path.relpath(path, site.articles_html_dir).replace("\\", "/")
+        written_paths.add(rel)
+        signature = hash_bytes(json.dumps({
+            "config": cfg,
+            "kind": kind,
+            "entries": feed_entries,
+            "links": list(links),
+            "archive": is_archive,
+        }, sort_keys=True).encode("utf-8"))
+        if feed_state.get(rel) == signature and os.path.exists(path):
+            return
+
+        fg = FeedGenerator()
+        fg.register_extension("history", HistoryExtension, atom=True, rss=True)
+        fg.id(feed_id)
+        fg.title(title)
+        fg.author({'name':siteName})
+        for rel_name, href in links:
+            fg.link(href=href, rel=rel_name)
+        fg.history.archive = is_archive
+        fg.history.links = list(links)
+        # RSS uses the last link added as its <link>, so the site link goes last
+        fg.link(href=site_root, rel='alternate')
+        fg.logo('http://' + siteURL + "/Images/logo.png")
+        fg.language('en')
+        fg.description(siteName + " " + feedType)
+
+        # Derive the build date from the content so identical entries give identical files
+        dates = [parse_date(e["updated"]) for e in feed_entries]
+        newest = max((d for d in dates if d), default=None)
+        if newest:
+            fg.lastBuildDate(newest)
+            fg.updated(newest)
+
+        for entry in feed_entries:
+            fe = fg.add_entry(order='append')
+            fe.id(entry["id"])
+            fe.title(entry["title"])
+            fe.link(href=entry["link"])
+            published = parse_date(entry["published"])
+            updated = parse_date(entry["updated"])
+            if published:
+                fe.pubDate(published)
+            if updated:
+                fe.updated(updated)
+            for tag in entry["tags"]:
+                fe.category(term=tag)
+
+            if contentMode in ("full", "summary"):
+                fragment = load_fragment(site, entry["slug"])
+                if fragment is not None:
+                    fragment = absolutize(fragment, entry["link"])
+                    fe.summary(summarize(fragment, summaryLength))
+                    if contentMode == "full":
+                        fe.content(fragment, type="CDATA" if kind == "rss" else "html")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if kind == "rss":
+            fg.rss_file(path)
+        else:
+            fg.atom_file(path)
+        compress_file(path)
+        feed_state[rel] = signature
+        written += 1
+
+    # Subscription feeds: the newest maxItems
+    archive_size = max(1, int(maxItems))
+    archive_pages = len(entries) // archive_size if archivePages == 1 else 0
+    current_links = []
+    if archive_pages:
+        current_links.append(("prev-archive", f"{site_root}/feeds/archive/{archive_pages}.xml"))
+
+    for kind, path in [("rss", rss_path)] * (rss == 1) + [("atom", atom_path)] * (atom == 1):
+        publish(path, kind, entries[:maxItems], site_root + "/feed", siteName + 'Feed', current_links)
+
+    # Archive pages (RFC 5005): complete chunks of archive_size, oldest first.
+    # Only full pages are published, so an archive page never changes once written.
+    oldest_first = entries[::-1]
+    for page in range(1, archive_pages + 1):
+        chunk = oldest_first[(page - 1) * archive_size:page * archive_size][::-1]
+        links = [("current", site_root + ("/atom.xml" if atom == 1 else "/rss.xml"))]
+        if page > 1:
+            links.append(("prev-archive", f"{site_root}/feeds/archive/{page - 1}.xml"))
+        if page < archive_pages:
+            links.append(("next-archive", f"{site_root}/feeds/archive/{page + 1}.xml"))
+        publish(os.path.join(feeds_dir, "archive", f"{page}.xml"), "atom", chunk,
+                f"{site_root}/feed/archive/{page}", f"{siteName}Feed archive {page}", links, is_archive=True)
+
+    # Per-tag feeds
+    if tagFeeds == 1:
+        by_tag = {}
+        for entry in entries:
+            for tag in entry["tags"]:
+                by_tag.setdefault(tag, [])
+                if len(by_tag[tag]) < maxItems:
+                    by_tag[tag].append(entry)
+        slugs = {tag: re.sub(r"[^A-Za-z0-9_-]+", "-", tag).strip("-").lower() or "tag" for tag in by_tag}
+        slug_counts = {}
+        for slug in slugs.values():
+            slug_counts[slug] = slug_counts.get(slug, 0) + 1
+        for tag, tag_entries in sorted(by_tag.items()):
+            tag_slug = slugs[tag]
+            if slug_counts[tag_slug] > 1:
+                # "C++" and "C#" would both be "c": tell them apart by a hash of the tag
+                tag_slug += "-" + hash_bytes(tag.encode("utf-8"))[:8]
+            base = os.path.join(feeds_dir, "tags", tag_slug)
+            for kind in ["rss"] * (rss == 1) + ["atom"] * (atom == 1):
+                publish(f"{base}-{kind}.xml", kind, tag_entries,
+                        f"{site_root}/feed/tags/{tag_slug}", f"{siteName}Feed: {tag}")
+
+    # Remove feeds that are no longer produced (format disabled, tag gone, ...)
+    for rel in sorted(set(feed_state) - written_paths):
+        path = os.path.join(site.articles_html_dir, rel)
+        if os.path.exists(path):
+            os.remove(path)
+        remove_compressed(path)
+        del feed_state[rel]
+        written += 1
+    for feed_file, enabled in [(rss_path, rss == 1), (atom_path, atom == 1)]:
+        if not enabled and os.path.exists(feed_file):
+            os.remove(feed_file)
+            remove_compressed(feed_file)
+
+    manifest["feeds"] = feed_state
+    save_manifest(site.manifest_path, manifest)
+    if written:
+        bump_generation(site.root_dir)
+        print(f"Updated {written} feed file(s)")
+    else:
+        print("Feeds unchanged")
+    return written
+
 
-if rss == 1:
-    fg.rss_file(articles_html_dir + '/rss.xml')
-if atom == 1:
-    fg.atom_file(articles_html_dir + '/atom.xml')
+if __name__ == "__main__":
+    from raven import Site
+    build_feeds(Site())
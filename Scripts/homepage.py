@@ -1,46 +1,32 @@
 from datetime import datetime
+import heapq
 import json
 import os
 import re
-import markdown
+from compress import compress_file, remove_compressed
+from converter import HIGHLIGHT_CSS_NAME, convert, highlight_css_link
+from images import image_markup_attrs
+from manifest import bump_generation, hash_bytes, hash_file, load_manifest, save_manifest
+from metaindex import load_index
+from templates import load_template
+from update import load_shared_config
 
 # ------------------------------------------------------------
-# Locate Root Directory
+# Config (Config/homepage.json), with these defaults for missing keys
 # ------------------------------------------------------------
-base_dir = os.path.dirname(os.path.abspath(__file__))
-current = base_dir
-root_dir = None
-while current != os.path.dirname(current):
-    if os.path.basename(current) == "Raven":
-        root_dir = current
-        break
-    current = os.path.dirname(current)
-if root_dir is None:
-    raise FileNotFoundError("Could not find 'Raven' folder in parent directories.")
+HOMEPAGE_DEFAULTS = {
+    "display": 5,
+    "previewLength": 150,
+}
 
-# ------------------------------------------------------------
-# Directory Setup
-# ------------------------------------------------------------
-drafts_dir = os.path.join(root_dir, "Drafts")
-articles_html_dir = os.path.join(root_dir, "Articles-html")
-articles_md_dir = os.path.join(root_dir, "Articles-md")
-metadata_dir = os.path.join(root_dir, "Articles-Metadata")
-site_html_dir = os.path.join(root_dir, "Site-html")
-config_dir = os.path.join(root_dir, "Config")
-
-# ------------------------------------------------------------
-# Set config vars in case of broken json
-# ------------------------------------------------------------
-display = 5
-previewLength = 150
+# The homepage replaces the page rendered from Drafts/main.md, whose
+# body becomes the introduction above the recent article cards
+homepage_slug = "main"
 
-# Load config
-homepage_path = os.path.join(metadata_dir, "homepage.json")
-if os.path.exists(homepage_path):
-    with open(homepage_path, "r", encoding="utf-8") as f:
-        homepage_meta = json.load(f)
-    for key, value in homepage_meta.items():
-        globals()[key] = value
+# Older cards go to Articles-html/page/<n>.html (served as /page/<n>),
+# and every article is listed by year and month in archive.html
+pages_dir_name = "page"
+archive_name = "archive.html"
 
 # ------------------------------------------------------------
 # Date formatting
@@ -66,141 +52,427 @@ def getFormattedDate(date_created_iso):
 # ------------------------------------------------------------
 # Preview generator
 # ------------------------------------------------------------
-def make_preview(content: str, previewLength: int) -> str:
-    # 1. Remove first H1 heading (robust to extra spaces and line endings)
-    content = re.sub(r"(?m)^#\s+.*(?:\r?\n|$)", "", content, count=1)
-
-    # 2. Remove custom tags entirely
-    content = re.sub(r"<not-article>", "", content)
-    content = re.sub(r"<thumbnail:[^>|]+\|[^>]+>", "", content)
-
-    # 3. Remove markdown images
-    content = re.sub(r"!\[[^\]]*\]\([^)]+\)", "", content)
-
-    # 4. Calculate cutoff based on visible characters
-    visible_count = 0
-    cutoff_index = 0
+# The H1, custom tags and images are stripped first, then one forward
+# pass counts visible characters up to the cutoff. Callers can hand it
+# just a prefix of the file (see preview_from_file), so a long article
+# costs about as much as a short one.
+_H1 = re.compile(r"(?m)^#\s+.*(?:\r?\n|$)")
+_THUMBNAIL_TAG = re.compile(r"<thumbnail:[^>|]+\|[^>]+>")
+_MD_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]+\)")
+_NOT_ARTICLE = re.compile(r"<not-article>")
+_TAGS_TAG = re.compile(r"<tags:[^>\n]*>")
+
+# With a prefix, anything this close to its end may continue past it
+_PREFIX_MARGIN = 1024
+
+# Stripping happens in this order; each stage sees the output of the
+# previous one, so removing a tag can join "!" and "[..](..)" into an image.
+# A stage is (pattern, max replacements, start token, completing endings)
+_STRIP_STAGES = [
+    (_H1, 1, None, ()),
+    (_NOT_ARTICLE, 0, "<not-article>", ()),
+    (_THUMBNAIL_TAG, 0, "<thumbnail:", (">", "|x>", "x|x>")),
+    (_TAGS_TAG, 0, "<tags:", (">",)),
+    (_MD_IMAGE, 0, "![", (")", "x)", "(x)", "](x)")),
+]
+
+def strip_hidden(content):
+    """content without its first H1, custom tags and images."""
+    for pattern, count, _, _ in _STRIP_STAGES:
+        content = pattern.sub("", content, count=count)
+    return content
+
+def _settled_length(content):
+    """How much of strip_hidden(content) is certain when content is only a prefix.
+
+    The last _PREFIX_MARGIN characters, and anything from the start of a
+    hidden construct that reaches (or might continue past) that point,
+    could still change once more of the document is read.
+    """
+    cut = max(len(content) - _PREFIX_MARGIN, 0)
+    for pattern, count, token, endings in _STRIP_STAGES:
+        for match in pattern.finditer(content):
+            if match.start() < cut < match.end():
+                cut = match.start()
+        if token:
+            # Started before the cut but not finished by it. Whatever
+            # follows the cut may still change, or be stripped later.
+            settled = content[:cut]
+            start = settled.find(token)
+            while start != -1:
+                if not pattern.match(settled, start) and any(pattern.match(settled + ending, start) for ending in endings):
+                    cut = start
+                    break
+                start = settled.find(token, start + 1)
+            # Too short to recognise yet: what follows the cut (or what
+            # stripping it later leaves) could complete it
+            for start in range(max(0, cut - len(token) + 1), cut):
+                if token.startswith(content[start:cut]):
+                    cut = start
+                    break
+        # Carry the cut over to the text the next stage sees
+        cut = len(pattern.sub("", content[:cut], count=count))
+        content = pattern.sub("", content, count=count)
+    return cut
+
+def make_preview(content: str, previewLength: int, complete: bool = True):
+    """Return the first ~previewLength visible characters of content plus "...".
+
+    Skips the first H1, custom tags and images; a link counts only its
+    text; the cut is moved to the end of a word and past the end of an
+    open code fence. If complete is False, content is only the start of
+    the document and None is returned when the preview might depend on
+    text beyond it.
+    """
+    # Past limit the stripped prefix may differ from the stripped document
+    limit = None if complete else _settled_length(content)
+    content = strip_hidden(content)
     length = len(content)
-
-    while cutoff_index < length and visible_count < previewLength:
-        # Handle markdown links: only count visible text
-        if content[cutoff_index] == "[":
-            end_bracket = content.find("]", cutoff_index)
+    limit = length if limit is None else min(limit, length)
+
+    visible = 0
+    i = 0
+    while visible < previewLength:
+        if i >= limit:
+            if complete:
+                break
+            return None
+        if content[i] == "[":
+            # Markdown link: only the text is visible
+            end_bracket = content.find("]", i)
+            if end_bracket == -1 and not complete:
+                return None
             if end_bracket != -1:
-                visible_count += end_bracket - cutoff_index - 1
-                cutoff_index = end_bracket + 1
-                if cutoff_index < length and content[cutoff_index] == "(":
-                    end_paren = content.find(")", cutoff_index)
+                visible += end_bracket - i - 1
+                i = end_bracket + 1
+                if i < length and content[i] == "(":
+                    end_paren = content.find(")", i)
+                    if end_paren == -1 and not complete:
+                        return None
                     if end_paren != -1:
-                        cutoff_index = end_paren + 1
+                        i = end_paren + 1
                 continue
+        visible += 1
+        i += 1
 
-        visible_count += 1
-        cutoff_index += 1
-
-    # 5. Avoid cutting inside a word
-    while cutoff_index < length and re.match(r"[A-Za-z0-9]", content[cutoff_index]):
-        cutoff_index += 1
-
-    # 6. Ensure code fences are respected (extend if inside ``` block)
-    code_fence_starts = [m.start() for m in re.finditer(r"```", content)]
-    for start in code_fence_starts:
-        if start < cutoff_index:
-            end = content.find("```", start + 3)
-            if end != -1 and end > cutoff_index:
-                cutoff_index = end + 3
+    # Avoid cutting inside a word
+    while i < length and content[i].isascii() and content[i].isalnum():
+        i += 1
 
-    preview = content[:cutoff_index].strip() + "..."
-    return preview
+    # Never cut inside a code block: a fence opened before the cut
+    # extends it to the next fence
+    fence = content.find("```")
+    while fence != -1 and fence < i:
+        end = content.find("```", fence + 3)
+        if end == -1:
+            if not complete:
+                return None
+            break
+        if end > i:
+            i = end + 3
+        fence = content.find("```", fence + 3)
+
+    # A fence starting just before i could still straddle the limit
+    if not complete and i + 2 > limit:
+        return None
+    return content[:i].strip() + "..."
+
+def preview_from_file(md_path, previewLength):
+    """Return (preview, first heading), reading only as much of the file as needed."""
+    size = max(4 * _PREFIX_MARGIN, previewLength * 16)
+    content = ""
+    with open(md_path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(size)
+            content += chunk
+            preview = make_preview(content, previewLength, complete=len(chunk) < size)
+            if preview is not None:
+                return preview, first_heading(content)
+            size *= 2
 
 # ------------------------------------------------------------
-# Globals for article data
+# Preview cards
+#
+# A card depends only on its article's markdown, metadata and the card
+# template, so rendered cards are memoised in the build manifest under
+# a hash of those inputs and unchanged articles are never re-previewed.
 # ------------------------------------------------------------
-mainlist = []
-i = 0
-
-def addPage(input):
-    global i
-    keys_order = ['article_number', 'title', 'date_created', 'thumbnail', 'thumbnailAltText']
-
-    # Add to mainlist
-    for key in keys_order:
-        mainlist.append(input.get(key))
-
-    def safe_get(offset):
-        index = offset + (i * 5)
-        return mainlist[index] if index < len(mainlist) else "default text"
-
-    id = safe_get(0)
-    title = safe_get(1)
-    dateRaw = safe_get(2)
-    date = getFormattedDate(dateRaw)
-    thumbnailLoc = safe_get(3)
-    thumbnailAltText = safe_get(4)
-
-    thumbnail = f'![{thumbnailAltText}]({thumbnailLoc})'
-
-    md_path = os.path.join(articles_md_dir, f"{title}.md")
-    if not os.path.exists(md_path):
-        print(f"Markdown file not found: {md_path}")
-        return
-
-    with open(md_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Strip first H1 consistently for preview and printing
-    content_no_h1 = re.sub(r"(?m)^#\s+.*(?:\r?\n|$)", "", content, count=1)
-
-    preview = make_preview(content_no_h1, previewLength)
-
-    previewProcessed = markdown.markdown(
-        preview,
-        extensions=['extra','smarty','toc','sane_lists','codehilite','md_in_html'],
-        extension_configs={
-            'smarty': {'smart_quotes': True, 'smart_dashes': True, 'smart_ellipses': True},
-            'codehilite': {'guess_lang': True, 'linenums': True, 'pygments_style': 'monokai', 'noclasses': True}
-        },
-        output_format="html5"
-    )
-
-
-   
+def first_heading(content):
+    match = re.search(r"(?m)^#\s+(.*?)\s*$", content)
+    return match.group(1) if match else None
+
+def thumbnail_html(meta, variant_map, sizes):
+    thumbnailLoc = meta.get("thumbnail")
+    if not thumbnailLoc:
+        return ""
+    thumbnailAltText = meta.get("thumbnailAltText", "")
+    url = "/" + thumbnailLoc.lstrip("/")
+    rel = thumbnailLoc[len("Images/"):] if thumbnailLoc.startswith("Images/") else thumbnailLoc
+    img_srcset, webp_srcset = image_markup_attrs(variant_map, rel, url)
+    img = f'<img src="{url}" alt="{thumbnailAltText}" loading="lazy" style="max-width:100%;"'
+    if img_srcset:
+        img += f' srcset="{img_srcset}" sizes="{sizes}"'
+    img += ">"
+    if webp_srcset:
+        img = f'<picture><source type="image/webp" srcset="{webp_srcset}" sizes="{sizes}">{img}</picture>'
+    return img
+
+def render_card(slug, meta, md_path, previewLength, card_template, variant_map, sizes, highlight=None):
+    """Return (card html, display title) for one article."""
+    preview, heading = preview_from_file(md_path, previewLength)
+    title = heading or slug
+    html = card_template.render({
+        "link": "/" + slug,
+        "title": title,
+        "date": getFormattedDate(meta.get("date_created")),
+        "thumbnail_html": thumbnail_html(meta, variant_map, sizes),
+        "preview_html": convert(preview, highlight),
+    })
+    return html, title
 
 # ------------------------------------------------------------
-# Find most recent articles
+# Collect articles
 # ------------------------------------------------------------
-def findRecents(display, metadata_dir, addPage):
-    global i
-    metadata_entries = []
+def collectArticles(metadata_index):
+    """One pass over the index: the listed articles plus their year/month buckets.
+
+    Returns ([(article_number, slug, meta)], {(year, month): [...]}). When
+    two metadata files share an article number the first slug by filename
+    is listed.
+    """
+    articles = []
+    by_month = {}
     seen = set()
 
-    for filename in os.listdir(metadata_dir):
-        if not filename.endswith(".json"):
+    for slug, data in sorted(metadata_index.items()):
+        article_num = data.get("article_number")
+        if slug == homepage_slug or data.get("not-article") is True:
+            continue
+        if article_num is None or article_num in seen:
             continue
+        seen.add(article_num)
+        article = (int(article_num), slug, data)
+        articles.append(article)
 
-        filepath = os.path.join(metadata_dir, filename)
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            article_num = data.get("article_number")
-            if article_num is not None and article_num not in seen:
-                seen.add(article_num)
-                metadata_entries.append(data)
+            dt = datetime.fromisoformat(data.get("date_created") or "")
+            month_key = (dt.year, dt.month)
+        except ValueError:
+            month_key = (0, 0)
+        by_month.setdefault(month_key, []).append(article)
 
-        except Exception as e:
-            print(f"Skipping {filename}: {e}")
+    return articles, by_month
 
-    # Sort DESC by article_number
-    metadata_entries.sort(key=lambda m: m.get("article_number", -1), reverse=True)
+def findRecents(display, articles):
+    """The newest `display` articles, newest first (top-k, no full sort)."""
+    return heapq.nlargest(display, articles, key=lambda a: a[0])
 
-    most_recent = metadata_entries[:display]
-
-    for meta in most_recent:
-        addPage(meta)
-        i += 1
+# ------------------------------------------------------------
+# Page chrome
+# ------------------------------------------------------------
+def page_url(page):
+    return "/" if page == 1 else f"/{pages_dir_name}/{page}"
+
+def pager_html(page, total):
+    links = []
+    if page > 1:
+        links.append(f'<a href="{page_url(page - 1)}">Newer</a>')
+    if total > 1:
+        links.append(f"Page {page} of {total}")
+    if page < total:
+        links.append(f'<a href="{page_url(page + 1)}">Older</a>')
+    links.append('<a href="/archive">Archive</a>')
+    return '<div class="pager" style="text-align:center; font-size:1.33em; margin:20px 0;">' + " &middot; ".join(links) + "</div>"
+
+def archive_html(by_month, cards):
+    parts = []
+    year = None
+    for (y, m) in sorted(by_month, reverse=True):
+        if y != year:
+            year = y
+            parts.append(f"<h2>{y}</h2>" if y else "<h2>Undated</h2>")
+        if y:
+            parts.append(f"<h3>{datetime(y, m, 1).strftime('%B')}</h3>")
+        parts.append("<ul>")
+        for article_num, slug, meta in sorted(by_month[(y, m)], key=lambda a: a[0], reverse=True):
+            title = cards[slug]["title"] if slug in cards else slug
+            parts.append(f'<li><a href="/{slug}">{title}</a> &ndash; {getFormattedDate(meta.get("date_created"))}</li>')
+        parts.append("</ul>")
+    return "\n".join(parts)
 
 # ------------------------------------------------------------
-# Run
+# Build main.html, page/<n>.html and archive.html
+#
+# Each output has its own signature in the manifest and is only
+# rewritten when its cards, navigation or chrome changed.
 # ------------------------------------------------------------
-findRecents(display, metadata_dir, addPage)
+def build_homepage(site):
+    """Write main.html, page/<n>.html and archive.html where they changed. Returns the pages written."""
+    display = site.homepage_config["display"]
+    previewLength = site.homepage_config["previewLength"]
+    homepage_card_path = site.config_path("homepageCard.txt")
+    homepage_out_path = os.path.join(site.articles_html_dir, homepage_slug + ".html")
+
+    manifest = load_manifest(site.manifest_path)
+    state = manifest.get("homepage") or {}
+    cached_cards = state.get("cards", {})
+    page_state = state.get("pages", {})
+    article_records = manifest.get("articles", {})
+    variant_map = manifest.get("images", {})
+    sizes = site.image_settings["sizes"]
+    card_template = load_template(homepage_card_path)
+    card_template_hash = hash_file(homepage_card_path)
+    per_page = max(1, int(display))
+
+    articles, by_month = collectArticles(load_index(site.root_dir))
+
+    cards = {}
+    def card_for(article):
+        article_num, slug, meta = article
+        if slug in cards:
+            return cards[slug]
+        md_path = os.path.join(site.articles_md_dir, f"{slug}.md")
+        # The manifest already knows the draft's hash; only hash the file when it doesn't
+        draft_hash = article_records.get(slug + ".md", {}).get("inputs", {}).get("draft") or hash_file(md_path)
+        if draft_hash is None:
+            print(f"Markdown file not found: {md_path}")
+            return None
+        thumbnail = meta.get("thumbnail") or ""
+        key = hash_bytes(json.dumps({
+            "markdown": draft_hash,
+            "metadata": meta,
+            "previewLength": previewLength,
+            "template": card_template_hash,
+            "highlight": site.highlight_settings,
+            "images": variant_map.get(thumbnail[len("Images/"):] if thumbnail.startswith("Images/") else thumbnail),
+        }, sort_keys=True).encode("utf-8"))
+
+        cached = cached_cards.get(slug)
+        if cached and cached["key"] == key:
+            cards[slug] = cached
+        else:
+            html, title = render_card(slug, meta, md_path, previewLength, card_template, variant_map, sizes,
+                                      site.highlight_settings)
+            cards[slug] = {"key": key, "html": html, "title": title}
+        return cards[slug]
+
+    # With more than one page every article is listed, so sort once and
+    # slice; a single page only needs the top few
+    total_pages = max(1, -(-len(articles) // per_page))
+    if total_pages > 1:
+        ordered = sorted(articles, key=lambda a: a[0], reverse=True)
+        pages = [ordered[i:i + per_page] for i in range(0, len(ordered), per_page)]
+    else:
+        pages = [findRecents(per_page, articles)]
+
+    # The same chrome as the articles (Config/page_*.txt). Asset URLs are
+    # root-absolute because page/<n>.html is one directory further down.
+    shared = load_shared_config(site, variant_map)
+    templates = shared["templates"]
+    chrome_vars = dict(shared["styles"])
+    chrome_vars.update(
+        site_name=shared["site_name"],
+        copyright_text=shared["copyright_text"],
+        rel_logo_path=shared["rel_logo_path"],
+        top_links_html=shared["top_links_html"],
+        local_css_name="/" + shared["local_css_name"],
+        favicon_name="/" + shared["favicon_name"],
+        highlight_css_html=highlight_css_link(site.highlight_settings, "/" + HIGHLIGHT_CSS_NAME),
+        prev_link_html="",
+        next_link_html="",
+        article_date_html="",
+    )
+    chrome_vars["separator_html"] = templates["separatorStyle"].render(chrome_vars)
+    chrome_vars["page_top"] = templates["page_top"].render(chrome_vars)
+    chrome_vars["page_bottom"] = templates["page_bottom"].render(chrome_vars)
+    chrome_hash = hash_bytes(json.dumps([chrome_vars, templates["page_full"].source], sort_keys=True).encode("utf-8"))
+
+    def render_page(title, body_html, heading=None):
+        page_vars = dict(chrome_vars, page_title=title, html_body=body_html)
+        page_vars["article_h1_html"] = f'<h1 style="{chrome_vars["TOP_H1_STYLE"]}">{heading}</h1>' if heading else ""
+        return templates["page_full"].render(page_vars)
+
+    intro_path = os.path.join(site.fragments_dir, homepage_slug + ".html")
+    main_md_path = os.path.join(site.articles_md_dir, homepage_slug + ".md")
+
+    def intro():
+        """(heading of Drafts/main.md, its rendered body)"""
+        heading = None
+        if os.path.exists(main_md_path):
+            with open(main_md_path, "r", encoding="utf-8") as f:
+                heading = first_heading(f.read())
+        if not os.path.exists(intro_path):
+            return heading, ""
+        with open(intro_path, "r", encoding="utf-8") as f:
+            return heading, f.read()
+
+    written = []
+    wanted = set()
+
+    def publish(path, signature_parts, render):
+        rel = os.path.relpath(path, site.articles_html_dir).replace("\\", "/")
+        wanted.add(rel)
+        signature = hash_bytes(json.dumps(dict(signature_parts, chrome=chrome_hash), sort_keys=True).encode("utf-8"))
+        previous = page_state.get(rel)
+        # update.py rewrites main.html whenever Drafts/main.md changes, so
+        # the file on disk must also still be the one written here
+        if previous and previous["signature"] == signature and previous["output"] == hash_file(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render())
+        os.replace(tmp_path, path)
+        compress_file(path)
+        page_state[rel] = {"signature": signature, "output": hash_file(path)}
+        written.append(rel)
+
+    def home_page(page, page_cards):
+        heading, intro_html = intro() if page == 1 else (None, "")
+        listing = "\n".join(
+            ([intro_html] if page == 1 else [])
+            + ['<div class="recent-articles">']
+            + [c["html"] for c in page_cards]
+            + ["</div>", pager_html(page, total_pages)]
+        )
+        site_name = chrome_vars["site_name"]
+        title = (heading or site_name) if page == 1 else f"{site_name} - Page {page}"
+        return render_page(title, listing, heading)
+
+    for page, page_articles in enumerate(pages, start=1):
+        page_cards = [c for c in map(card_for, page_articles) if c is not None]
+        path = homepage_out_path if page == 1 else os.path.join(site.articles_html_dir, pages_dir_name, f"{page}.html")
+        signature_parts = {"cards": [c["key"] for c in page_cards], "page": page, "total": total_pages}
+        if page == 1:
+            signature_parts.update(intro=hash_file(intro_path), main_md=hash_file(main_md_path))
+        publish(path, signature_parts, lambda page=page, page_cards=page_cards: home_page(page, page_cards))
+
+    archive_listing = sorted((a[1], a[2].get("date_created"), cards[a[1]]["title"]) for a in articles if a[1] in cards)
+    publish(os.path.join(site.articles_html_dir, archive_name), {"archive": archive_listing},
+            lambda: render_page(f"Archive - {chrome_vars['site_name']}", archive_html(by_month, cards), "Archive"))
+
+    # Pages that no longer exist (fewer articles, larger page size, ...)
+    for rel in sorted(set(page_state) - wanted):
+        path = os.path.join(site.articles_html_dir, rel)
+        if os.path.exists(path):
+            os.remove(path)
+        remove_compressed(path)
+        del page_state[rel]
+        written.append(rel)
+
+    if cards == cached_cards and not written:
+        print("Homepage unchanged")
+        return written
+
+    manifest["homepage"] = {"cards": cards, "pages": page_state}
+    save_manifest(site.manifest_path, manifest)
+    if written:
+        bump_generation(site.root_dir)
+        print(f"Homepage: wrote {len(written)} page(s), {total_pages} page(s) of {len(articles)} article(s)")
+    else:
+        print("Homepage unchanged")
+    return written
+
+if __name__ == "__main__":
+    from raven import Site
+    build_homepage(Site())
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import urllib.parse
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+# -------------------------------------------------------------------
+# Responsive image variants
+#
+# For every image in Images/, resized and recompressed copies (width
+# buckets, plus WebP when Pillow supports it) are written to
+# Articles-html/Variants/. Variant filenames carry a hash of the source
+# and the settings, so they never change meaning and can be cached
+# forever. Generated files are also kept in .image-cache/ at the site
+# root, so a --full rebuild or a reverted image reuses them instead of
+# resizing again.
+#
+# Needs Pillow; without it pages just use the original images.
+# -------------------------------------------------------------------
+VARIANTS_DIR_NAME = "Variants"
+CACHE_DIR_NAME = ".image-cache"
+RESIZABLE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+# Config/images.json overrides these (loaded by raven.Site)
+DEFAULT_SETTINGS = {
+    "widths": [320, 640, 1280],
+    "logo": "logo.png",
+    "logo_height": 120,     # 2x the 60px the page header shows it at
+    "quality": 82,
+    "webp": True,
+    "sizes": "(max-width: 800px) 100vw, 800px",
+}
+
+
+def _save(img, path, fmt, quality):
+    tmp_path = path + ".tmp"
+    if fmt == "JPEG":
+        img.convert("RGB").save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        img.save(tmp_path, "WEBP", quality=quality, method=6)
+    else:
+        img.save(tmp_path, fmt, optimize=True)
+    os.replace(tmp_path, path)
+
+
+def _variant_targets(size, rel, settings):
+    """Return [(descriptor, width, height)] for the variants one image should get."""
+    width, height = size
+    targets = [
+        (f"{w}w", w, max(1, round(height * w / width)))
+        for w in sorted(set(int(w) for w in settings["widths"]))
+        if w < width
+    ]
+    if rel == settings["logo"]:
+        # Extra fixed-height copy for the page header
+        target_h = int(settings["logo_height"])
+        if target_h < height:
+            targets.insert(0, (f"{target_h}h", max(1, round(width * target_h / height)), target_h))
+    return targets
+
+
+def build_variants(images_dir, root_dir, output_dir, settings, source_hashes):
+    """Generate variants for every image and return the variant map.
+
+    source_hashes maps an image's path relative to images_dir to its
+    content hash (update.py already has these from the Images sync).
+    The returned map is {rel: {"width": w, "height": h, "variants": [
+    {"descriptor": "640w", "url": ..., "width": ..., "height": ..., "type": ...}]}}.
+    """
+    variants_dir = os.path.join(output_dir, VARIANTS_DIR_NAME)
+    if Image is None:
+        if os.path.isdir(variants_dir):
+            shutil.rmtree(variants_dir)
+        print("Pillow is not installed; skipping responsive image variants")
+        return {}
+
+    cache_dir = os.path.join(root_dir, CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(variants_dir, exist_ok=True)
+    use_webp = settings["webp"] and features.check("webp")
+    settings_key = json.dumps(settings, sort_keys=True)
+
+    variant_map = {}
+    wanted = set()
+    generated = 0
+    for rel, source_hash in sorted(source_hashes.items()):
+        stem, ext = os.path.splitext(rel)
+        if ext.lower() not in RESIZABLE_EXTENSIONS:
+            continue
+        src = os.path.join(images_dir, rel)
+        key = hashlib.sha256((source_hash + settings_key).encode("utf-8")).hexdigest()[:12]
+        safe_stem = re.sub(r"[^A-Za-z0-9_-]", "_", stem)
+
+        # Dimensions are cached too, so unchanged images are never opened
+        info_path = os.path.join(cache_dir, f"{key}.json")
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        else:
+            with Image.open(src) as img:
+                info = {"width": img.width, "height": img.height, "format": img.format}
+            with open(info_path, "w", encoding="utf-8") as f:
+                json.dump(info, f)
+
+        formats = [(info["format"] or "PNG", ext.lower(), "")]
+        # The logo is a plain <img> in the page header, so it only needs its own format
+        if use_webp and info["format"] != "WEBP" and rel != settings["logo"]:
+            formats.append(("WEBP", ".webp", "image/webp"))
+
+        entries = []
+        img = None
+        for descriptor, width, height in _variant_targets((info["width"], info["height"]), rel, settings):
+            for fmt, out_ext, mime in formats:
+                name = f"{safe_stem}-{key}-{descriptor}{out_ext}"
+                cached = os.path.join(cache_dir, name)
+                if not os.path.exists(cached):
+                    if img is None:
+                        img = Image.open(src)
+                        if img.mode not in ("RGB", "RGBA", "L"):
+                            img = img.convert("RGBA")
+                    _save(img.resize((width, height), Image.LANCZOS), cached, fmt, int(settings["quality"]))
+                    generated += 1
+                dst = os.path.join(variants_dir, name)
+                if not os.path.exists(dst):
+                    shutil.copy2(cached, dst)
+                wanted.add(name)
+                entries.append({
+                    "descriptor": descriptor,
+                    "url": f"/{VARIANTS_DIR_NAME}/{name}",
+                    "width": width,
+                    "height": height,
+                    "type": mime,
+                })
+        if img is not None:
+            img.close()
+        variant_map[rel] = {"width": info["width"], "height": info["height"], "variants": entries}
+
+    # Drop variants of images that changed or were removed
+    for name in os.listdir(variants_dir):
+        if name not in wanted:
+            os.remove(os.path.join(variants_dir, name))
+
+    if generated:
+        print(f"Generated {generated} image variant(s)")
+    return variant_map
+
+
+# -------------------------------------------------------------------
+# Markup helpers
+# -------------------------------------------------------------------
+def _srcset(entries, original_url, original_width):
+    parts = [f"{e['url']} {e['width']}w" for e in entries]
+    if original_url:
+        parts.append(f"{original_url} {original_width}w")
+    return ", ".join(parts)
+
+
+def image_markup_attrs(variant_map, rel, original_url):
+    """Return (img srcset, webp srcset) for an image, either may be empty."""
+    info = variant_map.get(rel)
+    if not info:
+        return "", ""
+    same_format = [e for e in info["variants"] if not e["type"] and e["descriptor"].endswith("w")]
+    webp = [e for e in info["variants"] if e["type"] == "image/webp"]
+    img_srcset = _srcset(same_format, original_url, info["width"]) if same_format else ""
+    webp_srcset = _srcset(webp, None, None) if webp else ""
+    return img_srcset, webp_srcset
+
+
+def logo_url(variant_map, rel, fallback):
+    """URL of the logo's fixed-height header variant, or fallback."""
+    info = variant_map.get(rel)
+    if info:
+        for e in info["variants"]:
+            if not e["type"] and e["descriptor"].endswith("h"):
+                return e["url"]
+    return fallback
+
+
+_IMG_TAG = re.compile(r'<img([^>]*?)\ssrc="([^"]*?Images/([^"]+))"([^>]*)>')
+
+
+def add_srcset(html, variant_map, sizes):
+    """Give every <img> pointing into Images/ a srcset (and a WebP <picture> source)."""
+    if not variant_map:
+        return html
+
+    def replace(match):
+        before, url, rel, after = match.groups()
+        rel = urllib.parse.unquote(rel)
+        if "srcset=" in before + after:
+            return match.group(0)
+        img_srcset, webp_srcset = image_markup_attrs(variant_map, rel, url)
+        if not img_srcset and not webp_srcset:
+            return match.group(0)
+        img = f'<img{before} src="{url}"'
+        if img_srcset:
+            img += f' srcset="{img_srcset}" sizes="{sizes}"'
+        img += f"{after}>"
+        if not webp_srcset:
+            return img
+        return f'<picture><source type="image/webp" srcset="{webp_srcset}" sizes="{sizes}">{img}</picture>'
+
+    return _IMG_TAG.sub(replace, html)
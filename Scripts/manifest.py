@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# -------------------------------------------------------------------
+# Build manifest
+#
+# Records a content hash for every input a generated file depends on,
+# so update.py only regenerates outputs whose inputs actually changed.
+# Copied files also get their (mtime_ns, size) under "stamps", so an
+# unchanged source is not read again just to rehash it.
+# -------------------------------------------------------------------
+MANIFEST_NAME = ".build-manifest.json"
+MANIFEST_VERSION = 1
+
+# Touched after every build that changed outputs; server.py drops its
+# response cache when this file changes.
+GENERATION_NAME = ".build-generation"
+
+# Rendered article bodies (no page chrome), kept for feeds.py to reuse
+# instead of converting the markdown a second time.
+FRAGMENTS_DIR_NAME = ".build-fragments"
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    """Return the sha256 of a file, or None when it does not exist."""
+    if not os.path.isfile(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_files(paths):
+    """Combine the hashes of several files into one digest (order matters)."""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode("utf-8"))
+        h.update((hash_file(path) or "missing").encode("ascii"))
+    return h.hexdigest()
+
+
+def empty_manifest():
+    return {"version": MANIFEST_VERSION, "articles": {}, "assets": {}, "stamps": {}}
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return empty_manifest()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable build manifest: {e}")
+        return empty_manifest()
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+    manifest.setdefault("articles", {})
+    manifest.setdefault("assets", {})
+    manifest.setdefault("stamps", {})
+    return manifest
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def bump_generation(root_dir):
+    """Mark the generated site as changed so running servers invalidate their caches."""
+    path = os.path.join(root_dir, GENERATION_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_path, path)
+
+
+def _stamp(path):
+    """[mtime_ns, size] of a file, or None when it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def sync_file(src, dst, assets, key, stamps=None):
+    """Copy src to dst when its hash differs from the one recorded under key.
+
+    With a stamps dict, src is only hashed when its (mtime_ns, size)
+    differs from the stamp recorded there under key.
+    Returns True if the file was copied.
+    """
+    stamp = _stamp(src) if stamps is not None else None
+    if stamp is not None and stamps.get(key) == stamp and key in assets and os.path.exists(dst):
+        return False
+    digest = hash_file(src)
+    if digest is None:
+        return False
+    if assets.get(key) == digest and os.path.exists(dst):
+        if stamp is not None:
+            stamps[key] = stamp
+        return False
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copy2(src, dst)
+    assets[key] = digest
+    if stamp is not None:
+        stamps[key] = stamp
+    return True
+
+
+def sync_bytes(data, dst, assets, key):
+    """Write generated data to dst when its hash differs from the one recorded under key.
+
+    Returns True if the file was written.
+    """
+    digest = hash_bytes(data)
+    if assets.get(key) == digest and os.path.exists(dst):
+        return False
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp_path = dst + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, dst)
+    assets[key] = digest
+    return True
+
+
+def sync_tree(src_dir, dst_dir, assets, prefix, stamps=None):
+    """Mirror src_dir into dst_dir, copying only files whose hash changed.
+
+    Files in dst_dir that no longer exist in src_dir are removed.
+    Returns the number of files copied.
+    """
+    copied = 0
+    seen = set()
+    if os.path.isdir(src_dir):
+        for dirpath, _, filenames in os.walk(src_dir):
+            for filename in filenames:
+                src = os.path.join(dirpath, filename)
+                rel = os.path.relpath(src, src_dir).replace("\\", "/")
+                seen.add(rel)
+                if sync_file(src, os.path.join(dst_dir, rel), assets, prefix + rel, stamps):
+                    copied += 1
+
+    # Drop outputs whose source disappeared
+    if os.path.isdir(dst_dir):
+        for dirpath, _, filenames in os.walk(dst_dir, topdown=False):
+            for filename in filenames:
+                dst = os.path.join(dirpath, filename)
+                rel = os.path.relpath(dst, dst_dir).replace("\\", "/")
+                if rel not in seen:
+                    os.remove(dst)
+                    assets.pop(prefix + rel, None)
+                    if stamps is not None:
+                        stamps.pop(prefix + rel, None)
+            if dirpath != dst_dir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+    for key in [k for k in assets if k.startswith(prefix) and k[len(prefix):] not in seen]:
+        del assets[key]
+    if stamps is not None:
+        for key in [k for k in stamps if k.startswith(prefix) and k[len(prefix):] not in seen]:
+            del stamps[key]
+    return copied
@@ -1,111 +1,81 @@
 import sys
 import os
-import json
 from datetime import datetime
 import re
+from metaindex import allocate_metadata
 
-# -------------------------
-# Paths and setup
-# -------------------------
+def create_metadata(site, input_md_name):
+    """Write Articles-Metadata/<name>.json for Drafts/<input_md_name>.
 
-if len(sys.argv) < 2:
-    sys.exit(1)
+    Returns the new metadata, or None for non-articles and drafts that
+    already have metadata. Raises FileNotFoundError for a missing draft.
+    """
+    # Full path to Markdown
+    input_file = os.path.join(site.drafts_dir, input_md_name)
 
-input_md_name = sys.argv[1]  # Filename passed from CLI
+    if not os.path.exists(input_file):
+        raise FileNotFoundError(input_file)
 
+    # Compute base name safely (allow spaces)
+    basename_raw = os.path.splitext(input_md_name)[0]
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-root_dir = os.path.abspath(os.path.join(base_dir, ".."))
+    # Safe filename: remove unsafe characters
+    basename = re.sub(r"[^A-Za-z0-9 _-]", "", basename_raw).strip()
 
-metadata_dir = os.path.join(root_dir, "Articles-Metadata")
-drafts_dir = os.path.join(root_dir, "Drafts")
+    # -------------------------
+    # Read markdown
+    # -------------------------
 
-# Sanity check
-if not os.path.isdir(metadata_dir):
-    sys.exit(1)
+    with open(input_file, 'r', encoding='utf-8') as f:
+        text = f.read()
 
-if not os.path.isdir(drafts_dir):
-    sys.exit(1)
+    # -------------------------
+    # Parse special fields
+    # -------------------------
 
-# Full path to Markdown
-input_file = os.path.join(drafts_dir, input_md_name)
+    # Thumbnail
+    m = re.search(r"<thumbnail:(.*?)\|(.*?)>", text)
+    thumbnail, thumbnailAltText = (m.group(1), m.group(2)) if m else ("", "")
 
-if not os.path.exists(input_file):
-    sys.exit(1)
+    # Tags, for the per-tag feeds and Previous/Next links: <tags:python, web>.
+    # Only read when the metadata is created; to change them later, edit
+    # "tags" in Articles-Metadata/<name>.json.
+    m = re.search(r"<tags:(.*?)>", text)
+    tags = list(dict.fromkeys(t.strip() for t in m.group(1).split(",") if t.strip())) if m else []
 
-# Compute base name safely (allow spaces)
-basename_raw = os.path.splitext(input_md_name)[0]
+    # Check article type
+    if "<not-article>" in text:
+        return None
 
-# Safe filename: remove unsafe characters
-basename = re.sub(r"[^A-Za-z0-9 _-]", "", basename_raw).strip()
+    # -------------------------
+    # Create metadata file
+    # -------------------------
 
+    # The number is allocated and the file written under a lock, so
+    # parallel publishes can't share a number
+    return allocate_metadata(site.root_dir, basename, lambda article_number: {
+        "article_number": article_number,
+        "title": basename,
+        "date_created": datetime.now().isoformat(),
+        "thumbnail": thumbnail,
+        "thumbnailAltText": thumbnailAltText,
+        "tags": tags
+    })
 
 
-# -------------------------
-# Read markdown
-# -------------------------
+if __name__ == "__main__":
+    from raven import Site
 
-with open(input_file, 'r', encoding='utf-8') as f:
-    text = f.read()
+    if len(sys.argv) < 2:
+        sys.exit(1)
 
-# -------------------------
-# Parse special fields
-# -------------------------
+    site = Site()
 
-# Thumbnail
-m = re.search(r"<thumbnail:(.*?)\|(.*?)>", text)
-thumbnail, thumbnailAltText = (m.group(1), m.group(2)) if m else ("", "")
-
-# Check article type BEFORE removing tag
-is_article = "<not-article>" not in text
-
-# Remove tags
-text = text.replace("<not-article>", "")
-text = re.sub(r"<thumbnail:.*?>", "", text)
-
-
-# -------------------------
-# Load existing metadata numbers
-# -------------------------
-
-id_to_html = {}
-metadata_files = [f for f in os.listdir(metadata_dir) if f.endswith(".json")]
-
-for filename in metadata_files:
-    path = os.path.join(metadata_dir, filename)
-    with open(path, 'r', encoding='utf-8') as f:
-        meta = json.load(f)
-        article_id = meta.get("article_number")
-        html_file = os.path.splitext(filename)[0] + ".html"
-        id_to_html[article_id] = html_file
-
-sorted_ids = sorted(id_to_html.keys())
-
-# -------------------------
-# Create metadata file
-# -------------------------
-
-metadata_path = os.path.join(metadata_dir, f"{basename}.json")
-
-
-if not is_article:
-    sys.exit(0)
-
-if os.path.exists(metadata_path):
-    sys.exit(0)
-
-# Assign next article number
-article_number = (sorted_ids[-1] + 1) if sorted_ids else 1
-
-metadata = {
-    "article_number": article_number,
-    "title": basename,
-    "date_created": datetime.now().isoformat(),
-    "thumbnail": thumbnail,
-    "thumbnailAltText": thumbnailAltText
-}
-
-# Write JSON file
-with open(metadata_path, 'w', encoding='utf-8') as f:
-    json.dump(metadata, f, indent=4)
+    # Sanity check
+    if not os.path.isdir(site.metadata_dir) or not os.path.isdir(site.drafts_dir):
+        sys.exit(1)
 
+    try:
+        create_metadata(site, sys.argv[1])  # Filename passed from CLI
+    except FileNotFoundError:
+        sys.exit(1)
@@ -0,0 +1,204 @@
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; allocation still works, just without
+    # protection against concurrent publishers
+    fcntl = None
+
+# -------------------------------------------------------------------
+# Metadata index
+#
+# One compact JSON file holding every Articles-Metadata entry, keyed by
+# slug (the metadata filename without .json). Scripts load it with a
+# single read plus one stat per metadata file instead of opening every
+# file. Each entry's (mtime_ns, size) is recorded, so files added,
+# removed or edited in place (by hand or by another script) are
+# re-read on the next load and the rest are taken from the index.
+# -------------------------------------------------------------------
+INDEX_NAME = ".metadata-index.json"
+INDEX_VERSION = 2
+
+# Holds the last article number handed out. Also the lock file that
+# serialises allocation, metadata writes and index updates.
+COUNTER_NAME = ".article-counter"
+
+
+def index_path(root_dir):
+    return os.path.join(root_dir, INDEX_NAME)
+
+
+def _metadata_dir(root_dir):
+    return os.path.join(root_dir, "Articles-Metadata")
+
+
+def _scan_stamps(metadata_dir):
+    """{slug: [mtime_ns, size]} for every metadata file."""
+    stamps = {}
+    with os.scandir(metadata_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".json") and entry.is_file():
+                st = entry.stat()
+                stamps[entry.name[:-len(".json")]] = [st.st_mtime_ns, st.st_size]
+    return stamps
+
+
+def _read_metadata(metadata_dir, slug):
+    try:
+        with open(os.path.join(metadata_dir, slug + ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Skipping {slug}.json: {e}")
+        return None
+
+
+def _write_index(root_dir, entries, stamps):
+    data = {
+        "version": INDEX_VERSION,
+        "files": stamps,
+        "articles": entries,
+    }
+    write_json_atomic(index_path(root_dir), data, separators=(",", ":"), sort_keys=True)
+
+
+def _read_index(root_dir):
+    """(entries, stamps) from the index file, or two empty dicts."""
+    try:
+        with open(index_path(root_dir), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == INDEX_VERSION:
+            return data["articles"], data["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}, {}
+
+
+def _refresh(root_dir, entries, stamps):
+    """Bring entries/stamps up to date with Articles-Metadata. Returns True if anything changed."""
+    metadata_dir = _metadata_dir(root_dir)
+    current = _scan_stamps(metadata_dir)
+    changed = False
+    for slug in set(stamps) - set(current):
+        entries.pop(slug, None)
+        del stamps[slug]
+        changed = True
+    for slug, stamp in current.items():
+        if stamps.get(slug) == stamp:
+            continue
+        metadata = _read_metadata(metadata_dir, slug)
+        if metadata is None:
+            entries.pop(slug, None)
+        else:
+            entries[slug] = metadata
+        # Remembered even when unreadable, so a broken file is reported once per edit
+        stamps[slug] = stamp
+        changed = True
+    return changed
+
+
+def rebuild_index(root_dir):
+    """Scan Articles-Metadata, rewrite the index and return {slug: metadata}."""
+    entries, stamps = {}, {}
+    _refresh(root_dir, entries, stamps)
+    _write_index(root_dir, entries, stamps)
+    return entries
+
+
+def load_index(root_dir):
+    """Return {slug: metadata} for every article, re-reading only files that changed."""
+    entries, stamps = _read_index(root_dir)
+    if _refresh(root_dir, entries, stamps):
+        _write_index(root_dir, entries, stamps)
+    return entries
+
+
+def sorted_articles(entries):
+    """Return [(article_number, slug)] sorted by article_number, skipping entries without one."""
+    articles = []
+    for slug, meta in entries.items():
+        article_number = meta.get("article_number")
+        if article_number is None:
+            continue
+        articles.append((int(article_number), slug))
+    articles.sort()
+    return articles
+
+
+# -------------------------------------------------------------------
+# Article number allocation
+#
+# Numbers come from the counter file under an exclusive flock, so
+# publishers running in parallel never hand out the same number and
+# allocation doesn't scan the archive. Numbers are never reused, even
+# after an article is deleted. The next number is one past the higher
+# of the counter and the highest number in the index, since metadata
+# from another checkout arrives without that checkout's counter.
+# -------------------------------------------------------------------
+def write_json_atomic(path, data, **dump_args):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **dump_args)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _locked(path):
+    with open(path, "a+", encoding="utf-8") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def allocate_metadata(root_dir, slug, make_metadata):
+    """Create Articles-Metadata/<slug>.json with the next article number.
+
+    make_metadata(article_number) returns the metadata dict. The check
+    for an existing file, the allocation, the write and the index update
+    all happen under one lock. Returns the new metadata, or None if the
+    slug already had a metadata file.
+    """
+    metadata_path = os.path.join(_metadata_dir(root_dir), f"{slug}.json")
+    with _locked(os.path.join(root_dir, COUNTER_NAME)) as counter:
+        if os.path.exists(metadata_path):
+            return None
+
+        entries, stamps = _read_index(root_dir)
+        _refresh(root_dir, entries, stamps)
+
+        counter.seek(0)
+        last = counter.read().strip()
+        # The counter is local to this checkout; metadata pulled from
+        # elsewhere can already use higher numbers
+        articles = sorted_articles(entries)
+        last_number = max(int(last or 0), articles[-1][0] if articles else 0)
+
+        metadata = make_metadata(last_number + 1)
+        write_json_atomic(metadata_path, metadata, indent=4)
+
+        counter.seek(0)
+        counter.truncate()
+        counter.write(str(last_number + 1))
+        counter.flush()
+        os.fsync(counter.fileno())
+
+        st = os.stat(metadata_path)
+        entries[slug] = metadata
+        stamps[slug] = [st.st_mtime_ns, st.st_size]
+        _write_index(root_dir, entries, stamps)
+    return metadata
+
+
+if __name__ == "__main__":
+    # python3 metaindex.py <site root>  -- rebuild the index from scratch
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    print(f"Indexed {len(rebuild_index(root))} metadata file(s)")
@@ -0,0 +1,156 @@
+import json
+import os
+import queue
+import threading
+
+# -------------------------------------------------------------------
+# Request metrics and access logging for server.py
+#
+# Requests are grouped into route classes (page, text, image, feed,
+# redirect, 404, other) so the number of series stays small whatever
+# URLs clients ask for. RequestMetrics keeps a counter and a latency
+# histogram per (server, route, status) and renders them in the
+# Prometheus text format for /metrics.
+#
+# AccessLog writes one JSON object per request from a background
+# thread; handlers only put the record on a queue.
+# -------------------------------------------------------------------
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".svg", ".ico"}
+FEED_PATHS = {"/rss.xml", "/atom.xml"}
+
+
+def route_class(path, status):
+    """Route class of a request for path that was answered with status."""
+    if status == 404:
+        return "404"
+    if 300 <= status < 400 and status != 304:
+        return "redirect"
+    path = path.split("?", 1)[0]
+    ext = os.path.splitext(path)[1].lower()
+    if path.endswith(".text"):
+        return "text"
+    if path.startswith(("/Images/", "/Variants/")) or ext in IMAGE_EXTENSIONS:
+        return "image"
+    if path in FEED_PATHS or path.startswith("/feeds/"):
+        return "feed"
+    if ext in ("", ".html", ".htm"):
+        return "page"
+    return "other"
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+class RequestMetrics:
+    """Thread-safe request counters and latency histograms."""
+
+    LABELS = ("server", "route", "status")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}    # (server, route, status) -> [bucket counts..., +Inf count, sum, bytes]
+        self.counters = {}  # name -> value, for everything that isn't per request
+
+    def observe(self, server, route, status, seconds, sent_bytes=0):
+        key = (server, route, str(status))
+        with self.lock:
+            entry = self.series.get(key)
+            if entry is None:
+                entry = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-2] += seconds
+            entry[-1] += sent_bytes
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def render(self, gauges=()):
+        """Prometheus text exposition (format 0.0.4) of everything so far.
+
+        gauges is an iterable of (name, help, value) read at scrape time.
+        """
+        with self.lock:
+            series = {key: list(entry) for key, entry in sorted(self.series.items())}
+            counters = dict(self.counters)
+
+        n = len(self.buckets)
+        lines = [
+            "# HELP raven_http_requests_total HTTP requests by server, route class and status.",
+            "# TYPE raven_http_requests_total counter",
+        ]
+        for key, entry in series.items():
+            lines.append(f"raven_http_requests_total{{{_labels(self.LABELS, key)}}} {sum(entry[:n + 1])}")
+
+        lines += [
+            "# HELP raven_http_response_bytes_total Response body bytes sent.",
+            "# TYPE raven_http_response_bytes_total counter",
+        ]
+        for key, entry in series.items():
+            lines.append(f"raven_http_response_bytes_total{{{_labels(self.LABELS, key)}}} {entry[-1]}")
+
+        lines += [
+            "# HELP raven_http_request_duration_seconds Time from parsed request to last byte written.",
+            "# TYPE raven_http_request_duration_seconds histogram",
+        ]
+        for key, entry in series.items():
+            labels = _labels(self.LABELS, key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                lines.append(f'raven_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += entry[n]
+            lines.append(f'raven_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"raven_http_request_duration_seconds_sum{{{labels}}} {entry[-2]:.6f}")
+            lines.append(f"raven_http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+        for name, value in sorted(counters.items()):
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+        for name, help_text, value in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+class AccessLog:
+    """Append JSON lines to path from a daemon thread.
+
+    log() never blocks: when the writer falls max_queue records behind,
+    new records are dropped and counted instead.
+    """
+
+    def __init__(self, path, max_queue=10000, metrics=None):
+        self.path = path
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=max_queue)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="raven-access-log", daemon=True)
+        self.thread.start()
+
+    def log(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.metrics is not None:
+                self.metrics.increment("raven_access_log_dropped_total")
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self.queue.get()
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                # Flush once per burst rather than once per line
+                if self.queue.empty():
+                    f.flush()
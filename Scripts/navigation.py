@@ -0,0 +1,72 @@
+from metaindex import sorted_articles
+
+# -------------------------------------------------------------------
+# Navigation graph
+#
+# Built once per build from the metadata index:
+#
+#   {
+#       "order": [slug, ...],                 # oldest → newest by article_number
+#       "links": {
+#           slug: {
+#               "prev": slug or None,
+#               "next": slug or None,
+#               "series": {"name": ..., "prev": ..., "next": ...},  # if the metadata has "series"
+#               "tags": {tag: {"prev": ..., "next": ...}},          # if the metadata has "tags"
+#           },
+#       },
+#   }
+#
+# Every lookup afterwards is a dict access, so rendering N articles no
+# longer costs a list.index() per article.
+# -------------------------------------------------------------------
+def _chain(slugs):
+    """Yield (slug, prev, next) for each slug of an ordered list."""
+    for idx, slug in enumerate(slugs):
+        prev_slug = slugs[idx - 1] if idx > 0 else None
+        next_slug = slugs[idx + 1] if idx < len(slugs) - 1 else None
+        yield slug, prev_slug, next_slug
+
+
+def build_navigation(entries):
+    """Compute prev/next (plus series/tag neighbours) for every slug in the metadata index."""
+    ordered = sorted_articles(entries)
+    order = [slug for _, slug in ordered]
+
+    # One slug per article_number; when two files share a number the last
+    # one by filename wins, as it always has for the Previous/Next links.
+    id_to_slug = {}
+    for slug in sorted(entries):
+        article_number = entries[slug].get("article_number")
+        if article_number is not None:
+            id_to_slug[int(article_number)] = slug
+    sorted_ids = sorted(id_to_slug)
+
+    by_id = {}
+    for article_id, prev_id, next_id in _chain(sorted_ids):
+        by_id[article_id] = {
+            "prev": id_to_slug[prev_id] if prev_id is not None else None,
+            "next": id_to_slug[next_id] if next_id is not None else None,
+        }
+
+    links = {}
+    series_members = {}
+    tag_members = {}
+    for article_number, slug in ordered:
+        links[slug] = dict(by_id[article_number])
+        meta = entries[slug]
+        series = meta.get("series")
+        if series:
+            series_members.setdefault(series, []).append(slug)
+        for tag in meta.get("tags") or []:
+            tag_members.setdefault(tag, []).append(slug)
+
+    for series, slugs in series_members.items():
+        for slug, prev_slug, next_slug in _chain(slugs):
+            links[slug]["series"] = {"name": series, "prev": prev_slug, "next": next_slug}
+
+    for tag, slugs in tag_members.items():
+        for slug, prev_slug, next_slug in _chain(slugs):
+            links[slug].setdefault("tags", {})[tag] = {"prev": prev_slug, "next": next_slug}
+
+    return {"order": order, "links": links}
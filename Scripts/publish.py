@@ -1,34 +1,76 @@
+import argparse
+import glob
 import os
 import sys
 import shutil
-import subprocess
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-root_dir = os.path.abspath(os.path.join(base_dir, ".."))
+from metadata import create_metadata
+from raven import Site
 
-unpublished_dir = os.path.join(root_dir, "Unpublished")
-drafts_dir = os.path.join(root_dir, "Drafts")
-scripts_dir = os.path.join(root_dir, "Scripts")
+# -------------------------------------------------------------------
+# Publish drafts from Unpublished/
+#
+#   python3 publish.py post.md
+#   python3 publish.py "2024-*.md" other.md     (globs, relative to Unpublished)
+#
+# Every file is moved to Drafts and given its metadata first, then the
+# site is built once, in this process.
+# -------------------------------------------------------------------
+def expand(site, patterns):
+    """Unpublished filenames matching patterns, in order, without duplicates."""
+    names = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(os.path.join(glob.escape(site.unpublished_dir), pattern)))
+            if not matches:
+                print(f"No files match: {pattern}")
+        else:
+            matches = [os.path.join(site.unpublished_dir, pattern)]
+        for path in matches:
+            name = os.path.relpath(path, site.unpublished_dir)
+            if name not in names:
+                names.append(name)
+    return names
 
-if len(sys.argv) != 2:
-    sys.exit(1)
 
-md_file = sys.argv[1]
+def publish(site, md_files, workers=1):
+    """Move md_files from Unpublished to Drafts, create their metadata and build once.
 
-src = os.path.join(unpublished_dir, md_file)
-dest = os.path.join(drafts_dir, md_file)
+    Returns the number of files published.
+    """
+    published = []
+    for md_file in md_files:
+        src = os.path.join(site.unpublished_dir, md_file)
+        if not os.path.exists(src):
+            print(f"Source file not found: {src}")
+            continue
+        # Drafts is flat: a match from a subdirectory of Unpublished keeps only its filename
+        name = os.path.basename(md_file)
+        if name in published:
+            print(f"Skipping {md_file}: another {name} is already being published")
+            continue
+        # Move markdown file to Drafts
+        shutil.move(src, os.path.join(site.drafts_dir, name))
+        published.append(name)
 
-if not os.path.exists(src):
-    print(f"Source file not found: {src}")
-    sys.exit(1)
+    # Metadata before the build, so new pages get their date and
+    # Previous/Next links on the first render
+    for md_file in published:
+        create_metadata(site, md_file)
 
-# Move markdown file to Drafts
-shutil.move(src, dest)
+    if published:
+        site.build_all(workers=workers)
+    return len(published)
 
-# Run update.py
-update_script = os.path.join(scripts_dir, "update.py")
-subprocess.run(["python3", update_script], check=True, cwd=scripts_dir)
 
-# Run metadata.py with the markdown filename
-metadata_script = os.path.join(scripts_dir, "metadata.py")
-subprocess.run(["python3", metadata_script, md_file], check=True, cwd=scripts_dir)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish Unpublished drafts and rebuild the site once.")
+    parser.add_argument("files", nargs="+", help="markdown filenames or glob patterns in Unpublished/")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of render processes (0 = one per CPU core)")
+    args = parser.parse_args()
+
+    site = Site()
+    md_files = expand(site, args.files)
+    if publish(site, md_files, args.workers) != len(md_files) or not md_files:
+        sys.exit(1)
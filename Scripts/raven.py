@@ -0,0 +1,117 @@
+import json
+import os
+
+from manifest import FRAGMENTS_DIR_NAME, MANIFEST_NAME
+
+# -------------------------------------------------------------------
+# Build API
+#
+# A Site holds a site's paths and its Config files, loaded once, and
+# is passed to every build step:
+#
+#   from raven import Site
+#   site = Site()                 # or Site("/path/to/site")
+#   site.build_all()              # articles, feeds, homepage
+#   site.render_article("post.md")
+#   site.build_feeds()
+#   site.build_homepage()
+#
+# Long-running callers (watch mode, the server, benchmarks) keep one
+# Site around, so imports, compiled templates and the markdown
+# converter stay warm between builds. Call reload() after Config/
+# changes.
+#
+# The build modules are imported on first use: they import this module
+# for their own __main__ blocks, and importing server.py needs only
+# load_json_config.
+# -------------------------------------------------------------------
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_root(start=SCRIPTS_DIR):
+    """The site root: the nearest parent folder named "Raven", else the folder holding Scripts/."""
+    current = start
+    while current != os.path.dirname(current):
+        if os.path.basename(current) == "Raven":
+            return current
+        current = os.path.dirname(current)
+    return os.path.dirname(SCRIPTS_DIR)
+
+
+def load_json_config(config_dir, name, defaults):
+    """defaults updated with Config/<name>, if it exists and parses."""
+    settings = dict(defaults)
+    path = os.path.join(config_dir, name)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                settings.update(json.load(f))
+        except ValueError as e:
+            print(f"Ignoring broken {name}: {e}")
+    return settings
+
+
+class Site:
+    def __init__(self, root_dir=None):
+        self.root_dir = os.path.abspath(root_dir) if root_dir else find_root()
+        self.scripts_dir = SCRIPTS_DIR
+        self.drafts_dir = os.path.join(self.root_dir, "Drafts")
+        self.unpublished_dir = os.path.join(self.root_dir, "Unpublished")
+        self.articles_html_dir = os.path.join(self.root_dir, "Articles-html")
+        self.articles_md_dir = os.path.join(self.root_dir, "Articles-md")
+        self.metadata_dir = os.path.join(self.root_dir, "Articles-Metadata")
+        self.site_html_dir = os.path.join(self.root_dir, "Site-html")
+        self.config_dir = os.path.join(self.root_dir, "Config")
+        self.images_dir = os.path.join(self.root_dir, "Images")
+        self.fragments_dir = os.path.join(self.root_dir, FRAGMENTS_DIR_NAME)
+        self.manifest_path = os.path.join(self.root_dir, MANIFEST_NAME)
+        self.reload()
+
+    def reload(self):
+        """(Re)load the JSON config files."""
+        from converter import HIGHLIGHT_DEFAULTS
+        from feeds import FEED_DEFAULTS
+        from homepage import HOMEPAGE_DEFAULTS
+        from images import DEFAULT_SETTINGS as IMAGE_DEFAULTS
+
+        self.feed_config = load_json_config(self.config_dir, "feeds.json", FEED_DEFAULTS)
+        self.homepage_config = load_json_config(self.config_dir, "homepage.json", HOMEPAGE_DEFAULTS)
+        self.image_settings = load_json_config(self.config_dir, "images.json", IMAGE_DEFAULTS)
+        self.highlight_settings = load_json_config(self.config_dir, "highlight.json", HIGHLIGHT_DEFAULTS)
+
+    def config_path(self, name):
+        return os.path.join(self.config_dir, name)
+
+    # ---------------------------------------------------------------
+    # Build steps
+    # ---------------------------------------------------------------
+    def build_articles(self, full=False, workers=1, only=None):
+        """Render changed drafts (only those named in only, if given). Returns the md names rendered."""
+        from update import build_articles
+        return build_articles(self, full=full, workers=workers, only=only)
+
+    def render_article(self, md_name):
+        """Render one draft now, whether or not its inputs changed."""
+        from update import build_articles
+        return build_articles(self, only=[md_name], force=True)
+
+    def build_feeds(self):
+        from feeds import build_feeds
+        return build_feeds(self)
+
+    def build_homepage(self):
+        from homepage import build_homepage
+        return build_homepage(self)
+
+    def build_all(self, full=False, workers=1):
+        """The whole pipeline: articles, feeds, homepage."""
+        from manifest import bump_generation
+        from timing import stage
+        with stage("articles"):
+            rendered = self.build_articles(full=full, workers=workers)
+        with stage("feeds"):
+            self.build_feeds()
+        with stage("homepage"):
+            self.build_homepage()
+        bump_generation(self.root_dir)
+        return rendered
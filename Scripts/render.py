@@ -0,0 +1,263 @@
+import os
+import re
+import shutil
+from compress import compress_file
+from converter import convert
+from images import add_srcset
+from datetime import datetime
+from html.parser import HTMLParser
+from timing import collecting, stage
+
+# -------------------------------------------------------------------
+# Article rendering
+#
+# Everything here works from a "shared" dict (styles, top links,
+# templates, ...) that update.py loads once per build, and a per-article
+# "job" dict. Keeping it free of module-level build state lets the same
+# code run in-process or inside a process pool worker.
+# -------------------------------------------------------------------
+
+# -------------------------------------------------------------------
+# Helper functions
+# -------------------------------------------------------------------
+def remove_first_h1(md_text):
+    pattern = r'^(#\s+.+)$'
+    match = re.search(pattern, md_text, re.MULTILINE)
+    if match:
+        return md_text.replace(match.group(1), '', 1).lstrip('\n'), match.group(1)[2:].strip()
+    else:
+        return md_text, ""
+
+# -------------------------------------------------------------------
+# Separator check
+#
+# An article gets the separator when its body shows anything. This
+# has always been decided the way BeautifulSoup would after dropping
+# every element with no text that isn't an <img> or <math>: what's left
+# must contain text, an <img> or a <math>. So a lone image in an
+# otherwise empty <p> doesn't count.
+#
+# MeaningfulContentParser reaches the same answer while streaming and
+# stops at the first node that settles it. A node counts once every
+# element around it is known to be kept, i.e. has text of its own:
+#
+#   - comments, doctypes and processing instructions are never text
+#   - text inside script/style/template/rt/rp only counts as text of
+#     that (innermost) element, never of the page or of other elements
+#   - CDATA sections count as text for every element except those five
+# -------------------------------------------------------------------
+HIDDEN_TEXT_TAGS = {"script", "style", "template", "rt", "rp"}
+VOID_TAGS = {
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr", "image",
+    "img", "input", "isindex", "keygen", "link", "menuitem", "meta", "nextid", "param", "source",
+    "spacer", "track", "wbr",
+}
+VISIBLE_TEXT = ("text", "cdata")
+
+class _ContentFound(Exception):
+    pass
+
+class MeaningfulContentParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # One entry per open element: [name, text kinds it counts, has text, waiting candidate]
+        self.open_tags = []
+
+    @staticmethod
+    def kept(entry):
+        return entry[2] or entry[0] in ("img", "math")
+
+    def deepest_unsettled(self, depth):
+        for i in range(depth - 1, -1, -1):
+            if not self.kept(self.open_tags[i]):
+                return i
+        return None
+
+    def candidate(self):
+        """A visible node at the current position: counts once every open element is kept."""
+        i = self.deepest_unsettled(len(self.open_tags))
+        if i is None:
+            raise _ContentFound
+        self.open_tags[i][3] = True
+
+    def text(self, kind):
+        for entry in self.open_tags:
+            if kind in entry[1]:
+                entry[2] = True
+        if kind in VISIBLE_TEXT:
+            self.candidate()
+        # New text may have settled elements that candidates were waiting on
+        for i, entry in enumerate(self.open_tags):
+            if entry[3] and self.deepest_unsettled(i + 1) is None:
+                raise _ContentFound
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("img", "math"):
+            self.candidate()
+        if tag not in VOID_TAGS:
+            kinds = (tag,) if tag in HIDDEN_TEXT_TAGS else VISIBLE_TEXT
+            self.open_tags.append([tag, kinds, False, False])
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in ("img", "math"):
+            self.candidate()
+
+    def handle_endtag(self, tag):
+        if not any(entry[0] == tag for entry in self.open_tags):
+            return
+        while True:
+            entry = self.open_tags.pop()
+            # A candidate waiting on an element that ended empty is dropped with it
+            if entry[3] and entry[2]:
+                self.candidate()
+            if entry[0] == tag:
+                break
+
+    def handle_data(self, data):
+        if data.strip():
+            hidden = [entry[0] for entry in self.open_tags if entry[0] in HIDDEN_TEXT_TAGS]
+            self.text(hidden[-1] if hidden else "text")
+
+    def unknown_decl(self, data):
+        if data.startswith("CDATA[") and data[len("CDATA["):].strip():
+            self.text("cdata")
+
+def has_meaningful_content(html):
+    parser = MeaningfulContentParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except _ContentFound:
+        return True
+    return False
+
+def prepend_image_path(match):
+    alt_text = match.group(1)
+    img_file = match.group(2)
+    if '/' not in img_file and '\\' not in img_file:
+        img_file = f"../Images/{img_file}"
+    return f"![{alt_text}]({img_file})"
+
+def rewrite_html_links(match):
+    text_l = match.group(1)
+    url = match.group(2)
+    if url.endswith(".html"):
+        url = "/" + url[:-5]
+    return f"[{text_l}]({url})"
+
+# -------------------------------------------------------------------
+# Render one article
+# -------------------------------------------------------------------
+def render_article(job, shared):
+    """Render job["text"] to HTML, write both outputs and return the job's log line."""
+    text = job["text"]
+    templates = shared["templates"]
+
+    with stage("prepare"):
+        text = text.replace("<not-article>", "")
+        text = re.sub(r"<thumbnail:.*?>", "", text)
+        text = re.sub(r"<tags:.*?>", "", text)
+
+        # Remove first H1
+        text, first_h1 = remove_first_h1(text)
+
+        # Fix image paths
+        text_for_html = re.sub(r'!\[([^\]]*)\]\(([^)]+)\)', prepend_image_path, text)
+
+        # Rewrite links
+        text_for_html = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', rewrite_html_links, text_for_html)
+
+    # Convert Markdown → HTML
+    with stage("markdown"):
+        html_body = convert(text_for_html, shared["highlight"])
+
+    # srcset / WebP sources for images that have resized variants
+    with stage("srcset"):
+        html_body = add_srcset(html_body, shared["image_variants"], shared["image_sizes"])
+
+    # -------------------------------------------------------------------
+    # Precompute template variables
+    # -------------------------------------------------------------------
+    page_vars = dict(shared["styles"])
+    page_vars.update(
+        site_name=shared["site_name"],
+        copyright_text=shared["copyright_text"],
+        rel_logo_path=shared["rel_logo_path"],
+        top_links_html=shared["top_links_html"],
+        local_css_name=shared["local_css_name"],
+        favicon_name=shared["favicon_name"],
+        highlight_css_html=shared["highlight_css_html"],
+        prev_link_html=job["prev_link_html"],
+        next_link_html=job["next_link_html"],
+        html_body=html_body,
+    )
+
+    top_h1_style = page_vars["TOP_H1_STYLE"]
+    page_vars["article_h1_html"] = f'<h1 style="{top_h1_style}">{first_h1}</h1>' if first_h1 else ""
+    page_vars["article_date_html"] = ""
+    date_created_iso = job.get("date_created")
+    if date_created_iso:
+        dt = datetime.fromisoformat(date_created_iso)
+        formatted_date = dt.strftime("%d %B %Y, %H:%M")
+        page_vars["article_date_html"] = f'<div style="font-size:0.9em; margin-bottom: 10px;">{formatted_date}</div>'
+
+    # -------------------------------------------------------------------
+    # Separator HTML
+    # -------------------------------------------------------------------
+    with stage("separator"):
+        meaningful = has_meaningful_content(html_body)
+
+    # -------------------------------------------------------------------
+    # Fill page templates
+    # -------------------------------------------------------------------
+    with stage("templates"):
+        page_vars["separator_html"] = templates["separatorStyle"].render(page_vars) if meaningful else ""
+        page_vars["page_top"] = templates["page_top"].render(page_vars)
+        page_vars["page_bottom"] = templates["page_bottom"].render(page_vars)
+        page_vars["page_title"] = first_h1 if first_h1 else shared["site_name"]
+        html_full = templates["page_full"].render(page_vars)
+
+    # -------------------------------------------------------------------
+    # Write HTML and Markdown
+    # -------------------------------------------------------------------
+    with stage("write"):
+        with open(job["html_path"], 'w', encoding='utf-8') as f:
+            f.write(html_full)
+
+        shutil.copy2(job["input_file"], job["md_out_path"])
+
+        with open(job["fragment_path"], 'w', encoding='utf-8') as f:
+            f.write(html_body)
+
+    # Precompressed copies for the server
+    with stage("compress"):
+        compress_file(job["html_path"])
+        compress_file(job["md_out_path"])
+
+    basename = os.path.splitext(job["md_name"])[0]
+    return f"Article: {basename}, Prev: {job['prev_link_html']}, Next: {job['next_link_html']}"
+
+def render_timed(job, shared):
+    """render_article, plus the article's stage times when shared["timings"] is set.
+
+    Returns (log line, {stage: [wall, cpu, calls]} or None).
+    """
+    if not shared.get("timings"):
+        return render_article(job, shared), None
+    with collecting() as timings:
+        with stage("total"):
+            log_line = render_article(job, shared)
+    return log_line, timings.stages
+
+# -------------------------------------------------------------------
+# Process pool support
+# -------------------------------------------------------------------
+_worker_shared = None
+
+def init_worker(shared):
+    """Pool initializer: receive the build-wide config once per worker."""
+    global _worker_shared
+    _worker_shared = shared
+
+def render_in_worker(job):
+    return render_timed(job, _worker_shared)
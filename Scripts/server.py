@@ -1,34 +1,61 @@
+import email.utils
+import fnmatch
+import hashlib
 import http.server
+import ipaddress
 import ssl
 import os
+import selectors
+import socket
 import subprocess
 import threading
+import time
 import urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from compress import ENCODINGS, is_compressible
+from manifest import GENERATION_NAME
+from metrics import AccessLog, RequestMetrics, route_class
+from raven import load_json_config
 
 # Configuration
-# Detect project root folder ("Raven")
-base_dir = os.path.dirname(os.path.abspath(__file__))
-current = base_dir
-root_dir = None
-
-while current != os.path.dirname(current):
-    if os.path.basename(current) == "Raven":
-        root_dir = current
-        break
-    current = os.path.dirname(current)
-
-if root_dir is None:
-    raise FileNotFoundError("Could not find Raven root directory")
-
-# Serve HTML from the correct location (clone-safe)
-SERVE_DIR = os.path.join(root_dir, "Articles-html")
-HOST = "0.0.0.0"
-HTTP_PORT = 80
-HTTPS_PORT = 443
+# Self-signed certificate, kept in the served folder
 CERT_FILE = "server.pem"
 
-os.chdir(SERVE_DIR)
+# Server settings (Config/server.json overrides these defaults)
+SERVER_DEFAULTS = {
+    "host": "0.0.0.0",
+    "http_port": 80,
+    "https_port": 443,
+    "workers": 32,             # threads serving connections
+    "max_connections": 256,    # open connections (served + queued) before accept() waits
+    "backlog": 128,            # listen() queue beyond max_connections
+    "keepalive_timeout": 5,    # seconds a silent new or idle keep-alive connection is kept open (without a worker)
+    "cache_max_bytes": 64 * 1024 * 1024,    # response cache budget, 0 disables the cache
+    "cache_max_entry_bytes": 4 * 1024 * 1024,
+    "cache_check_interval": 1.0,            # seconds between checks of the build generation marker
+    # Cache-Control by URL path, first matching pattern wins
+    "cache_control": [
+        # Variant names carry a content hash; Images/ keeps the author's file names
+        ["/Variants/*", "public, max-age=31536000, immutable"],
+        ["/Images/*", "public, max-age=86400"],
+        ["/rss.xml", "public, max-age=300"],
+        ["/atom.xml", "public, max-age=300"],
+        ["/feeds/archive/*", "public, max-age=86400"],
+        ["/feeds/*", "public, max-age=300"],
+        ["*.css", "public, max-age=86400"],
+        ["*", "no-cache"],
+    ],
+    # Pages reload themselves after each build (for watch.py); development only
+    "live_reload": False,
+    "live_reload_timeout": 25,  # seconds a reload poll is held open
+    # Prometheus metrics, answered only to loopback clients; "" disables them
+    "metrics_path": "/metrics",
+    # JSON-lines access log relative to the project root, written by a background thread; "" disables it
+    "access_log": "",
+    "access_log_queue": 10000,  # records buffered before new ones are dropped
+}
 
 # Function to check if certificate is expired
 def cert_expired(cert_path):
@@ -47,20 +74,552 @@ def cert_expired(cert_path):
         return True  # Treat errors as expired
 
 # Generate self-signed cert if missing or expired
-if not os.path.exists(CERT_FILE) or cert_expired(CERT_FILE):
-    print("Generating new self-signed certificate...")
-    subprocess.run([
-        "openssl", "req", "-new", "-x509",
-        "-keyout", CERT_FILE, "-out", CERT_FILE,
-        "-days", "365", "-nodes", "-subj", "/CN=localhost"
-    ], check=True)
+def ensure_cert(cert_path):
+    if not os.path.exists(cert_path) or cert_expired(cert_path):
+        print("Generating new self-signed certificate...")
+        subprocess.run([
+            "openssl", "req", "-new", "-x509",
+            "-keyout", cert_path, "-out", cert_path,
+            "-days", "365", "-nodes", "-subj", "/CN=localhost"
+        ], check=True)
+
+# Thread-pool server
+class PooledHTTPServer(http.server.HTTPServer):
+    """HTTPServer that hands each connection to a bounded pool of worker threads.
+
+    Workers only run once a connection has something to read. New
+    connections, and kept-alive ones whose handler finished a request
+    with nothing more to read (handler.parked), are parked with a
+    selector thread that waits for their next bytes (up to
+    keepalive_timeout seconds). Clients that connect and then stall,
+    before or during the TLS handshake or between requests, don't tie
+    up workers.
+
+    At most max_connections connections are held at once (served, queued
+    or parked). When that limit is reached the longest-idle parked
+    connection is closed to make room; if none is parked, accept() waits
+    and new clients queue in the listen backlog.
+
+    Handlers reach the shared Serving state through self.server.serving.
+    """
+
+    def __init__(self, server_address, handler_class, serving, workers, max_connections, backlog, keepalive_timeout):
+        self.request_queue_size = backlog
+        super().__init__(server_address, handler_class)
+        self.serving = serving
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="raven-http")
+        self.connection_slots = threading.BoundedSemaphore(max_connections)
+        self.keepalive_timeout = keepalive_timeout
+        # Parked connections: socket -> (client address, idle deadline), oldest first.
+        # Only the selector thread touches these; other threads post to parked_ops.
+        self.parked = OrderedDict()
+        self.parked_ops = deque()
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ)
+        threading.Thread(target=self.watch_parked, name="raven-keepalive", daemon=True).start()
+
+    def process_request(self, request, client_address):
+        if not self.connection_slots.acquire(blocking=False):
+            # Full: close the longest-idle keep-alive connection to make room
+            self.post(("evict",))
+            self.connection_slots.acquire()
+        # A worker picks it up once the client has sent something (its TLS ClientHello or request)
+        self.post(("park", request, client_address))
+
+    def process_request_thread(self, request, client_address):
+        handler = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+        if handler is not None and getattr(handler, "parked", False):
+            self.post(("park", request, client_address))
+        else:
+            self.close_connection(request)
+
+    def close_connection(self, request):
+        self.shutdown_request(request)
+        self.connection_slots.release()
+
+    def post(self, op):
+        self.parked_ops.append(op)
+        try:
+            self.wakeup_send.send(b"\0")
+        except OSError:
+            pass
+
+    def watch_parked(self):
+        while True:
+            now = time.monotonic()
+            timeout = None
+            if self.parked:
+                timeout = max(0.0, next(iter(self.parked.values()))[1] - now)
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self.wakeup_recv:
+                    try:
+                        while self.wakeup_recv.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                # First or next request (or EOF) arrived: serve it on a worker
+                sock = key.fileobj
+                self.selector.unregister(sock)
+                client_address, _ = self.parked.pop(sock)
+                self.pool.submit(self.process_request_thread, sock, client_address)
+
+            while self.parked_ops:
+                op = self.parked_ops.popleft()
+                if op[0] == "park":
+                    _, sock, client_address = op
+                    self.parked[sock] = (client_address, time.monotonic() + self.keepalive_timeout)
+                    self.selector.register(sock, selectors.EVENT_READ)
+                elif op[0] == "evict" and self.parked:
+                    self.drop_parked(next(iter(self.parked)))
+
+            now = time.monotonic()
+            while self.parked:
+                sock, (_, deadline) = next(iter(self.parked.items()))
+                if deadline > now:
+                    break
+                self.drop_parked(sock)
+
+    def drop_parked(self, sock):
+        self.selector.unregister(sock)
+        del self.parked[sock]
+        self.close_connection(sock)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+def make_server(address, handler_class, serving):
+    config = serving.config
+    return PooledHTTPServer(
+        address,
+        handler_class,
+        serving,
+        workers=int(config["workers"]),
+        max_connections=int(config["max_connections"]),
+        backlog=int(config["backlog"]),
+        keepalive_timeout=float(config["keepalive_timeout"]),
+    )
+
+# In-memory response cache
+class ResponseCache:
+    """LRU map of (request path, encodings) → (headers, body), bounded by total body bytes.
+
+    update.py and feeds.py rewrite the generation marker after each build;
+    when its stat changes the whole cache is dropped.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes, marker_path, check_interval):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.marker_path = marker_path
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.generation = self.read_generation()
+        self.next_check = time.monotonic() + check_interval
+
+    def read_generation(self):
+        try:
+            st = os.stat(self.marker_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def check_generation(self):
+        # Called with the lock held; stats the marker at most once per interval
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+        generation = self.read_generation()
+        if generation != self.generation:
+            self.generation = generation
+            self.entries.clear()
+            self.size = 0
+
+    def get(self, key):
+        if self.max_bytes <= 0:
+            return None
+        with self.lock:
+            self.check_generation()
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, headers, body):
+        if self.max_bytes <= 0 or len(body) > self.max_entry_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[key] = (headers, body)
+            self.size += len(body)
+            while self.size > self.max_bytes and self.entries:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+# State shared by both servers
+class Serving:
+    """A site's server settings plus the cache, metrics and access log its handlers share."""
+
+    def __init__(self, site):
+        self.config = load_json_config(site.config_dir, "server.json", SERVER_DEFAULTS)
+        config = self.config
+        self.serve_dir = site.articles_html_dir
+        self.markdown_dir = site.articles_md_dir
+        self.generation_path = os.path.join(site.root_dir, GENERATION_NAME)
+        self.host = config["host"]
+        self.http_port = int(config["http_port"])
+        self.https_port = int(config["https_port"])
+        self.live_reload = bool(config["live_reload"])
+        self.metrics_path = config["metrics_path"]
+        self.request_metrics = RequestMetrics()
+        self.access_log = None
+        if config["access_log"]:
+            self.access_log = AccessLog(
+                os.path.join(site.root_dir, config["access_log"]),
+                max_queue=int(config["access_log_queue"]),
+                metrics=self.request_metrics,
+            )
+        self.response_cache = ResponseCache(
+            max_bytes=int(config["cache_max_bytes"]),
+            max_entry_bytes=int(config["cache_max_entry_bytes"]),
+            marker_path=self.generation_path,
+            check_interval=float(config["cache_check_interval"]),
+        )
+
+def parse_accept_encoding(header):
+    """Return {coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+# -------------------------------------------------------------------
+# Live reload
+#
+# With live_reload on, HTML pages get a small script that long-polls
+# /__livereload. The request is held until the build generation marker
+# changes (or the timeout passes) and the page reloads when it has.
+# -------------------------------------------------------------------
+LIVE_RELOAD_PATH = "/__livereload"
+LIVE_RELOAD_SCRIPT = b"""<script>
+(function () {
+    var generation = null;
+    function poll() {
+        fetch("%s" + (generation ? "?since=" + generation : ""), {cache: "no-store"})
+            .then(function (r) { return r.text(); })
+            .then(function (current) {
+                if (generation && current !== generation) { location.reload(); return; }
+                generation = current;
+                poll();
+            })
+            .catch(function () { setTimeout(poll, 2000); });
+    }
+    poll();
+})();
+</script>
+""" % LIVE_RELOAD_PATH.encode("ascii")
+
+def current_generation(generation_path):
+    try:
+        with open(generation_path, "r", encoding="ascii") as f:
+            return f.read().strip() or "0"
+    except OSError:
+        return "0"
+
+def inject_live_reload(body):
+    index = body.rfind(b"</body>")
+    if index == -1:
+        return body + LIVE_RELOAD_SCRIPT
+    return body[:index] + LIVE_RELOAD_SCRIPT + body[index:]
+
+def cache_control_for(rules, url_path):
+    for pattern, value in rules:
+        if fnmatch.fnmatchcase(url_path, pattern):
+            return value
+    return None
+
+def is_loopback(host):
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    if getattr(address, "ipv4_mapped", None):
+        address = address.ipv4_mapped
+    return address.is_loopback
+
+# -------------------------------------------------------------------
+# Request instrumentation
+#
+# Both servers time every GET and HEAD from the parsed request to the
+# last byte written, and record it in the request metrics (and the access log
+# when one is configured) under its route class and status.
+# -------------------------------------------------------------------
+class InstrumentedHandler:
+    server_label = "https"
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # body of a keep-alive response waits on the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.serving = self.server.serving
+        super().setup()
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == "content-length":
+            self.response_length = int(value)
+        super().send_header(keyword, value)
+
+    def log_request(self, code="-", size="-"):
+        # The structured access log replaces the per-request stderr line
+        if self.serving.access_log is None:
+            super().log_request(code, size)
+
+    def send_metrics(self):
+        response_cache = self.serving.response_cache
+        gauges = [
+            ("raven_response_cache_entries", "Responses held in the in-memory cache.", len(response_cache.entries)),
+            ("raven_response_cache_bytes", "Body bytes held in the in-memory cache.", response_cache.size),
+        ]
+        body = self.serving.request_metrics.render(gauges).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.write_body(body)
+
+    def write_body(self, body):
+        # A HEAD response carries the GET headers (Content-Length included) but no body
+        if self.command != "HEAD":
+            self.wfile.write(body)
 
-# HTTPS handler
-class SecureHandler(http.server.SimpleHTTPRequestHandler):
     def do_GET(self):
+        request_path = self.path
+        if self.serving.live_reload and request_path.split("?", 1)[0] == LIVE_RELOAD_PATH:
+            # Long polls would only skew the latency histograms
+            self.handle_get()
+            return
+
+        started = time.perf_counter()
+        self.response_status = None
+        self.response_length = 0
+        self.route = None  # set by handle_get when the status alone doesn't tell
+        try:
+            metrics_path = self.serving.metrics_path
+            if metrics_path and request_path.split("?", 1)[0] == metrics_path and is_loopback(self.client_address[0]):
+                self.send_metrics()
+            else:
+                self.handle_get()
+        finally:
+            if self.response_status is not None:
+                self.record_request(request_path, time.perf_counter() - started)
+
+    # Same routing, validators and Cache-Control as GET; write_body drops the body
+    do_HEAD = do_GET
+
+    def record_request(self, request_path, seconds):
+        route = self.route or route_class(request_path, self.response_status)
+        # HEAD responses announce a Content-Length but send no body
+        sent_bytes = 0 if self.command == "HEAD" else self.response_length
+        self.serving.request_metrics.observe(self.server_label, route, self.response_status, seconds, sent_bytes)
+        if self.serving.access_log is not None:
+            self.serving.access_log.log({
+                "time": datetime.now().astimezone().isoformat(timespec="milliseconds"),
+                "server": self.server_label,
+                "client": self.client_address[0],
+                "method": self.command,
+                "path": request_path,
+                "status": self.response_status,
+                "route": route,
+                "bytes": sent_bytes,
+                "duration_ms": round(seconds * 1000, 3),
+                "referer": self.headers.get("Referer"),
+                "user_agent": self.headers.get("User-Agent"),
+            })
+
+# HTTPS handler
+class SecureHandler(InstrumentedHandler, http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive; every response must carry Content-Length
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # Bounds reads once a request has started arriving; idle time between requests is the server's keepalive_timeout
+        self.timeout = self.server.keepalive_timeout
+        super().setup()
+
+    def handle(self):
+        # Serve the requests that have already arrived, then hand an idle
+        # keep-alive connection back to the server rather than block this worker on it
+        self.parked = False
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if not self.input_pending():
+                self.parked = True
+                return
+            self.handle_one_request()
+
+    def input_pending(self):
+        """True if the next request's bytes are already buffered or readable without waiting."""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def not_modified(self, headers):
+        """True if the request's validators match this response (RFC 9110 §13.1)."""
+        fields = dict(headers)
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            etag = fields.get("ETag")
+            if etag is None:
+                return False
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        last_modified = fields.get("Last-Modified")
+        if if_modified_since and last_modified:
+            try:
+                return email.utils.parsedate_to_datetime(last_modified) <= email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def send_body(self, headers, body):
+        if self.not_modified(headers):
+            self.send_response(304)
+            for name, value in headers:
+                if name in ("ETag", "Last-Modified", "Cache-Control", "Vary"):
+                    self.send_header(name, value)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.write_body(body)
+
+    def accepted_encodings(self):
+        """Precompressed encodings this client accepts, best first."""
+        accepted = parse_accept_encoding(self.headers.get("Accept-Encoding", ""))
+        wildcard = accepted.get("*", 0.0)
+        return tuple(encoding for encoding, _ in ENCODINGS if accepted.get(encoding, wildcard) > 0)
+
+    def load_file(self, file_path, content_type, encodings, url_path=None):
+        """Read file_path, or its freshest acceptable .br/.gz sibling, into (headers, body).
+
+        With url_path the response gets an ETag, Last-Modified and the
+        Cache-Control rule for that path; without it, no validators at all.
+        """
+        source_mtime = os.stat(file_path).st_mtime
+        live_reload = self.serving.live_reload and content_type.startswith("text/html")
+        if live_reload:
+            # The script goes into the identity body, so skip the precompressed copies
+            encodings = ()
+        read_path = file_path
+        content_encoding = None
+        if is_compressible(file_path):
+            suffixes = dict(ENCODINGS)
+            for encoding in encodings:
+                sibling = file_path + suffixes[encoding]
+                try:
+                    # Ignore siblings older than the file they were made from
+                    if os.stat(sibling).st_mtime >= source_mtime:
+                        read_path, content_encoding = sibling, encoding
+                        break
+                except OSError:
+                    continue
+
+        with open(read_path, "rb") as f:
+            body = f.read()
+        if live_reload:
+            body = inject_live_reload(body)
+        headers = [("Content-type", content_type)]
+        if content_encoding:
+            headers.append(("Content-Encoding", content_encoding))
+        if is_compressible(file_path):
+            headers.append(("Vary", "Accept-Encoding"))
+        headers.append(("Content-Length", str(len(body))))
+        if url_path is None:
+            headers.append(("Cache-Control", "no-store"))
+            return headers, body
+
+        # Strong validator: hash of the exact bytes sent, so each encoding has its own
+        headers.append(("ETag", '"' + hashlib.sha256(body).hexdigest()[:32] + '"'))
+        headers.append(("Last-Modified", self.date_time_string(source_mtime)))
+        cache_control = cache_control_for(self.serving.config["cache_control"], url_path)
+        if cache_control:
+            headers.append(("Cache-Control", cache_control))
+        return headers, body
+
+    def live_reload_poll(self):
+        """Answer with the build generation once it differs from ?since= (or on timeout)."""
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        since = query.get("since", [None])[0]
+        deadline = time.monotonic() + float(self.serving.config["live_reload_timeout"])
+        generation_path = self.serving.generation_path
+        generation = current_generation(generation_path)
+        while since == generation and time.monotonic() < deadline:
+            time.sleep(0.25)
+            generation = current_generation(generation_path)
+        body = generation.encode("ascii")
+        self.send_response(200)
+        self.send_header("Content-type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.write_body(body)
+
+    def handle_get(self):
+        if self.serving.live_reload and self.path.split("?", 1)[0] == LIVE_RELOAD_PATH:
+            self.live_reload_poll()
+            return
+
+        response_cache = self.serving.response_cache
+        request_path = self.path
+        encodings = self.accepted_encodings()
+        cached = response_cache.get((request_path, encodings))
+        if cached is not None:
+            self.send_body(*cached)
+            return
+
         if self.path in ("/main", "/main.html"):
             self.send_response(301)
             self.send_header("Location", "/")
+            self.send_header("Content-Length", "0")
             self.end_headers()
             return
 
@@ -69,13 +628,11 @@ class SecureHandler(http.server.SimpleHTTPRequestHandler):
 
         if self.path.endswith(".text"):
             decoded_path = urllib.parse.unquote(self.path.lstrip("/").rsplit(".text", 1)[0])
-            md_path = os.path.join(os.path.dirname(SERVE_DIR), "Articles-md", decoded_path + ".md")
+            md_path = os.path.join(self.serving.markdown_dir, decoded_path + ".md")
             if os.path.exists(md_path):
-                self.send_response(200)
-                self.send_header("Content-Type", "text/plain; charset=utf-8")
-                self.end_headers()
-                with open(md_path, "r", encoding="utf-8") as f:
-                    self.wfile.write(f.read().encode("utf-8"))
+                headers, body = self.load_file(md_path, "text/plain; charset=utf-8", encodings, urllib.parse.unquote(request_path))
+                response_cache.put((request_path, encodings), headers, body)
+                self.send_body(headers, body)
                 return
             else:
                 self.send_error(404, "Markdown not found")
@@ -88,20 +645,47 @@ class SecureHandler(http.server.SimpleHTTPRequestHandler):
                 self.path = "/" + fs_path + ".html"
                 fs_path = urllib.parse.unquote(self.path.lstrip("/"))
 
+        cache_key = (request_path, encodings)
+        url_path = "/" + fs_path
         if not os.path.exists(fs_path):
             if os.path.exists("404.html"):
                 self.path = "/404.html"
+                # The 404 page goes out as 200, so count it by hand
+                self.route = "404"
+                # No validators or caching: the URL may exist after the next build
+                url_path = None
+                # Cache the 404 page once, not once per missing URL, and apart
+                # from a direct /404.html request, which does get validators
+                cache_key = ("404-fallback", encodings)
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    self.send_body(*cached)
+                    return
             else:
                 self.send_error(404, "File not found")
                 return
 
-        return super().do_GET()
+        # Regular files are read whole and cached; directories etc. go through the stock handler
+        file_path = self.translate_path(self.path)
+        if os.path.isfile(file_path):
+            headers, body = self.load_file(file_path, self.guess_type(file_path), encodings, url_path)
+            response_cache.put(cache_key, headers, body)
+            self.send_body(headers, body)
+            return
+
+        # Named explicitly: super().do_GET is the instrumented one, which would come back here
+        if self.command == "HEAD":
+            return http.server.SimpleHTTPRequestHandler.do_HEAD(self)
+        return http.server.SimpleHTTPRequestHandler.do_GET(self)
 
 # HTTP → HTTPS redirect
-class RedirectToHTTPSHandler(http.server.BaseHTTPRequestHandler):
-    def do_GET(self):
+class RedirectToHTTPSHandler(InstrumentedHandler, http.server.BaseHTTPRequestHandler):
+    server_label = "http"
+
+    def handle_get(self):
         host = self.headers.get("Host", "localhost").split(":")[0]
-        new_url = f"https://{host}{self.path}" if HTTPS_PORT == 443 else f"https://{host}:{HTTPS_PORT}{self.path}"
+        https_port = self.serving.https_port
+        new_url = f"https://{host}{self.path}" if https_port == 443 else f"https://{host}:{https_port}{self.path}"
         self.send_response(301)
         self.send_header("Location", new_url)
         self.end_headers()
@@ -110,21 +694,31 @@ class RedirectToHTTPSHandler(http.server.BaseHTTPRequestHandler):
         return
 
 # Run HTTPS server
-def run_https():
-    httpsd = http.server.HTTPServer((HOST, HTTPS_PORT), SecureHandler)
+def run_https(serving):
+    httpsd = make_server((serving.host, serving.https_port), SecureHandler, serving)
     context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
     context.load_cert_chain(certfile=CERT_FILE)
-    httpsd.socket = context.wrap_socket(httpsd.socket, server_side=True)
+    # Handshake lazily in the worker thread, so a slow client can't stall accept()
+    httpsd.socket = context.wrap_socket(httpsd.socket, server_side=True, do_handshake_on_connect=False)
     httpsd.serve_forever()
 
 # Run HTTP redirect
-def run_http_redirect():
-    httpd = http.server.HTTPServer((HOST, HTTP_PORT), RedirectToHTTPSHandler)
+def run_http_redirect(serving):
+    httpd = make_server((serving.host, serving.http_port), RedirectToHTTPSHandler, serving)
     httpd.serve_forever()
 
+def serve(site):
+    """Serve site's Articles-html over HTTPS, redirecting HTTP to it, until interrupted."""
+    serving = Serving(site)
+    # The handlers resolve request paths (and the certificate) relative to the served folder
+    os.chdir(serving.serve_dir)
+    ensure_cert(CERT_FILE)
+    threading.Thread(target=run_http_redirect, args=(serving,), daemon=True).start()
+    run_https(serving)
+
 if __name__ == "__main__":
-    threading.Thread(target=run_http_redirect, daemon=True).start()
+    from raven import Site
     try:
-        run_https()
+        serve(Site())
     except KeyboardInterrupt:
         print("\nReceived Keyboard Interrupt")
@@ -0,0 +1,55 @@
+import os
+
+# -------------------------------------------------------------------
+# Config templates
+#
+# Page templates (page_top.txt, page_full.txt, ...) are plain text with
+# {placeholder} fields and are filled in as an f-string. Style templates
+# (toplinksStyle.txt, separatorStyle.txt) are already Python f-string
+# expressions. Either way the source is compiled once into a code object
+# and each render is a single eval against the page variables.
+# -------------------------------------------------------------------
+
+# Templates whose file content is itself an expression rather than f-string text
+EXPRESSION_TEMPLATES = {"toplinksStyle", "separatorStyle"}
+
+_cache = {}
+
+
+class Template:
+    def __init__(self, source, name="<template>", expression=False):
+        self.source = source
+        self.name = name
+        self.expression = expression
+        code_source = source if expression else f"f'''{source}'''"
+        self.code = compile(code_source, name, "eval")
+
+    def render(self, variables):
+        return eval(self.code, {}, variables)
+
+    def __reduce__(self):
+        # Code objects can't be pickled; process pool workers recompile once on receipt
+        return (Template, (self.source, self.name, self.expression))
+
+
+def load_template(path, expression=False):
+    """Load and compile a template file, reusing the compiled copy while the file is unchanged."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), expression)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read().strip()
+    template = Template(source, os.path.basename(path), expression)
+    _cache[key] = ((stat.st_mtime_ns, stat.st_size), template)
+    return template
+
+
+def load_templates(config_dir, names):
+    """Return {name: Template} for Config/<name>.txt."""
+    return {
+        name: load_template(os.path.join(config_dir, name + ".txt"), name in EXPRESSION_TEMPLATES)
+        for name in names
+    }
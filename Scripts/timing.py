@@ -0,0 +1,111 @@
+import json
+import time
+from contextlib import contextmanager
+
+# -------------------------------------------------------------------
+# Build timing
+#
+# Code marks its stages with
+#
+#   with stage("markdown"):
+#       ...
+#
+# which costs nothing unless a collector is active. update.py starts
+# one per build when asked for timings (--timings) and one per article
+# while rendering, so a summary can show both the slowest stages and
+# the slowest articles. Stages nest: "highlight" time is also part of
+# the enclosing "markdown" time.
+# -------------------------------------------------------------------
+
+
+class Timings:
+    """Wall and CPU seconds per stage, plus per-article breakdowns."""
+
+    def __init__(self):
+        self.stages = {}    # name -> [wall, cpu, calls]
+        self.articles = {}  # article -> {stage: [wall, cpu, calls]}
+
+    def add(self, name, wall, cpu, calls=1):
+        entry = self.stages.setdefault(name, [0.0, 0.0, 0])
+        entry[0] += wall
+        entry[1] += cpu
+        entry[2] += calls
+
+    def add_article(self, article, stages, prefix="render."):
+        """Record one article's stages and add them to the build totals under prefix."""
+        self.articles[article] = stages
+        for name, (wall, cpu, calls) in stages.items():
+            self.add(prefix + name, wall, cpu, calls)
+
+    def as_dict(self):
+        return {
+            "stages": {
+                name: {"wall_s": round(wall, 6), "cpu_s": round(cpu, 6), "calls": calls}
+                for name, (wall, cpu, calls) in sorted(self.stages.items())
+            },
+            "articles": {
+                article: {name: round(wall, 6) for name, (wall, _, _) in sorted(stages.items())}
+                for article, stages in sorted(self.articles.items())
+            },
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=4)
+
+    def summary(self, top=10):
+        lines = ["Stages (wall / cpu seconds, nested stages are included in their parents):"]
+        for name, (wall, cpu, calls) in sorted(self.stages.items(), key=lambda item: item[1][0], reverse=True):
+            lines.append(f"  {name:<24} {wall:>9.3f} {cpu:>9.3f}  x{calls}")
+
+        if self.articles:
+            lines.append(f"Slowest articles (of {len(self.articles)}):")
+            totals = []
+            for article, stages in self.articles.items():
+                total = stages.get("total", [sum(s[0] for s in stages.values())])[0]
+                slowest = max((item for item in stages.items() if item[0] != "total"),
+                              key=lambda item: item[1][0], default=None)
+                totals.append((total, article, slowest))
+            totals.sort(reverse=True)
+            for total, article, slowest in totals[:top]:
+                worst = f"  (mostly {slowest[0]}: {slowest[1][0]:.3f})" if slowest else ""
+                lines.append(f"  {article:<40} {total:>9.3f}{worst}")
+        return "\n".join(lines)
+
+
+_stack = []
+
+
+@contextmanager
+def collecting():
+    """Collect stage times into a new Timings for the duration of the block."""
+    timings = Timings()
+    _stack.append(timings)
+    try:
+        yield timings
+    finally:
+        _stack.remove(timings)
+
+
+def active():
+    return bool(_stack)
+
+
+@contextmanager
+def stage(name):
+    if not _stack:
+        yield
+        return
+    timings = _stack[-1]
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def record_article(article, stages):
+    """Add an article's stage times (e.g. from a pool worker) to the active collector."""
+    if _stack:
+        _stack[-1].add_article(article, stages)
@@ -1,60 +1,22 @@
 import os
 import shutil
-import markdown
+import argparse
 import json
 import re
-import subprocess
-from datetime import datetime
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
+from manifest import empty_manifest, hash_bytes, hash_files, load_manifest, save_manifest, sync_bytes, sync_file, sync_tree
+from compress import compress_file, compressed_siblings
+from converter import HIGHLIGHT_CSS_NAME, highlight_css, highlight_css_link
+from images import build_variants, logo_url
+from render import init_worker, render_in_worker, render_timed
+from templates import load_templates
+from metaindex import load_index
+from navigation import build_navigation
+from timing import active, record_article, stage
 
-# -------------------------------------------------------------------
-# Locate Root Directory ("Raven")
-# -------------------------------------------------------------------
 base_dir = os.path.dirname(os.path.abspath(__file__))
-current = base_dir
-root_dir = None
-while current != os.path.dirname(current):
-    if os.path.basename(current) == "Raven":
-        root_dir = current
-        break
-    current = os.path.dirname(current)
-if root_dir is None:
-    raise FileNotFoundError("Could not find 'Raven' folder in parent directories.")
 
-# -------------------------------------------------------------------
-# Directory Setup
-# -------------------------------------------------------------------
-drafts_dir = os.path.join(root_dir, "Drafts")
-articles_html_dir = os.path.join(root_dir, "Articles-html")
-articles_md_dir = os.path.join(root_dir, "Articles-md")
-metadata_dir = os.path.join(root_dir, "Articles-Metadata")
-site_html_dir = os.path.join(root_dir, "Site-html")
-config_dir = os.path.join(root_dir, "Config")
-
-config_css_path = os.path.join(config_dir, "global.css")
-name_txt_path = os.path.join(config_dir, "name.txt")
-toplinks_txt_path = os.path.join(config_dir, "toplinks.txt")
-copyright_txt_path = os.path.join(config_dir, "copyright.txt")
-topstyle_path = os.path.join(config_dir, "topstyle.css")
-bottomstyle_path = os.path.join(config_dir, "bottomstyle.css")
-logo_path_full = os.path.join(root_dir, "Images/logo.png")
-
-server_script = os.path.join(root_dir, "Scripts", "server.py")
-feeds_script = os.path.join(root_dir, "Scripts", "feeds.py")
-
-# -------------------------------------------------------------------
-# Clean old generated articles
-# -------------------------------------------------------------------
-for d in [articles_html_dir, articles_md_dir]:
-    if os.path.exists(d):
-        for filename in os.listdir(d):
-            file_path = os.path.join(d, filename)
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-    else:
-        os.makedirs(d, exist_ok=True)
+PAGE_TEMPLATES = ["toplinksStyle", "separatorStyle", "page_top", "page_bottom", "page_full"]
 
 # -------------------------------------------------------------------
 # Load Style Vars
@@ -72,265 +34,357 @@ def load_style_vars(path):
                     style_vars[match.group(1)] = match.group(2)
     return style_vars
 
-top_vars = load_style_vars(topstyle_path)
-bottom_vars = load_style_vars(bottomstyle_path)
-
-TOP_DIV_STYLE = top_vars.get("TOP_DIV_STYLE", "display:flex; align-items:center; justify-content:space-between; padding:10px 0;")
-TOP_LOGO_STYLE = top_vars.get("TOP_LOGO_STYLE", "max-height:60px; margin-right:15px;")
-TOP_LINK_STYLE = top_vars.get("TOP_LINK_STYLE", "margin-left:15px; font-size:1.5em")
-TOP_H1_STYLE = top_vars.get("TOP_H1_STYLE", "margin:0; font-size:3em; font-style: normal;")
-TOP_HR_STYLE = top_vars.get("TOP_HR_STYLE", "border:none; height:1px; background-color:#ccc; margin: 15px 0;")
-
-BOTTOM_HR_STYLE = bottom_vars.get("BOTTOM_HR_STYLE", "border:none; height:1px; background-color:#ccc;")
-BOTTOM_DIV_STYLE = bottom_vars.get("BOTTOM_DIV_STYLE", "font-size:1.33em; display:flex; justify-content:space-between; padding:10px 0;")
-BOTTOM_COPYRIGHT_STYLE = bottom_vars.get("BOTTOM_COPYRIGHT_STYLE", "text-align:center; font-size:0.9em; margin-top:10px;")
-
 # -------------------------------------------------------------------
-# Ensure favicon + Images
+# Load Config Data (once per build, shared with every worker)
 # -------------------------------------------------------------------
-favicon_target = os.path.join(articles_html_dir, "favicon.ico")
-favicon_source = os.path.join(config_dir, "favicon.ico")
-if os.path.exists(favicon_target):
-    try:
-        os.remove(favicon_target)
-    except:
-        pass
-try:
-    shutil.copy2(favicon_source, favicon_target)
-except:
-    pass
-
-images_src = os.path.join(root_dir, "Images")
-images_dst = os.path.join(articles_html_dir, "Images")
-if os.path.exists(images_dst):
-    shutil.rmtree(images_dst)
-shutil.copytree(images_src, images_dst)
-
-# Create output dirs
-for d in [articles_html_dir, articles_md_dir, metadata_dir, site_html_dir]:
-    os.makedirs(d, exist_ok=True)
+def load_shared_config(site, image_variants):
+    top_vars = load_style_vars(site.config_path("topstyle.css"))
+    bottom_vars = load_style_vars(site.config_path("bottomstyle.css"))
+
+    styles = {
+        "TOP_DIV_STYLE": top_vars.get("TOP_DIV_STYLE", "display:flex; align-items:center; justify-content:space-between; padding:10px 0;"),
+        "TOP_LOGO_STYLE": top_vars.get("TOP_LOGO_STYLE", "max-height:60px; margin-right:15px;"),
+        "TOP_LINK_STYLE": top_vars.get("TOP_LINK_STYLE", "margin-left:15px; font-size:1.5em"),
+        "TOP_H1_STYLE": top_vars.get("TOP_H1_STYLE", "margin:0; font-size:3em; font-style: normal;"),
+        "TOP_HR_STYLE": top_vars.get("TOP_HR_STYLE", "border:none; height:1px; background-color:#ccc; margin: 15px 0;"),
+        "BOTTOM_HR_STYLE": bottom_vars.get("BOTTOM_HR_STYLE", "border:none; height:1px; background-color:#ccc;"),
+        "BOTTOM_DIV_STYLE": bottom_vars.get("BOTTOM_DIV_STYLE", "font-size:1.33em; display:flex; justify-content:space-between; padding:10px 0;"),
+        "BOTTOM_COPYRIGHT_STYLE": bottom_vars.get("BOTTOM_COPYRIGHT_STYLE", "text-align:center; font-size:0.9em; margin-top:10px;"),
+    }
+
+    site_name = ""
+    if os.path.exists(site.config_path("name.txt")):
+        with open(site.config_path("name.txt"), 'r', encoding='utf-8') as f:
+            site_name = f.read().strip()
+
+    top_links = []
+    if os.path.exists(site.config_path("toplinks.txt")):
+        with open(site.config_path("toplinks.txt"), 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    parts = line.strip().split(maxsplit=1)
+                    if len(parts) == 2:
+                        top_links.append(parts)
 
-# -------------------------------------------------------------------
-# Copy robots.txt if it exists
-# -------------------------------------------------------------------
-robots_src = os.path.join(config_dir, "robots.txt")
-robots_dst = os.path.join(articles_html_dir, "robots.txt")
-if os.path.exists(robots_src):
-    try:
-        shutil.copy2(robots_src, robots_dst)
-        print("Copied robots.txt to Articles-html")
-    except Exception as e:
-        print(f"Failed to copy robots.txt: {e}")
+    copyright_text = ""
+    if os.path.exists(site.config_path("copyright.txt")):
+        with open(site.config_path("copyright.txt"), 'r', encoding='utf-8') as f:
+            copyright_text = f.read().strip()
 
+    templates = load_templates(site.config_dir, PAGE_TEMPLATES)
 
+    # Relative logo path (the downscaled variant when there is one)
+    rel_logo_path = os.path.relpath(os.path.join(site.images_dir, "logo.png"), site.articles_html_dir).replace("\\", "/")
+    rel_logo_path = logo_url(image_variants, site.image_settings["logo"], rel_logo_path)
 
-# -------------------------------------------------------------------
-# Load Config Data
-# -------------------------------------------------------------------
-site_name = ""
-if os.path.exists(name_txt_path):
-    with open(name_txt_path, 'r', encoding='utf-8') as f:
-        site_name = f.read().strip()
-
-top_links = []
-if os.path.exists(toplinks_txt_path):
-    with open(toplinks_txt_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                parts = line.strip().split(maxsplit=1)
-                if len(parts) == 2:
-                    top_links.append(parts)
-
-copyright_text = ""
-if os.path.exists(copyright_txt_path):
-    with open(copyright_txt_path, 'r', encoding='utf-8') as f:
-        copyright_text = f.read().strip()
+    # Top links HTML
+    top_links_html = " ".join(
+        [templates["toplinksStyle"].render(dict(styles, name=name, link=link)) for name, link in top_links]
+    )
 
-# -------------------------------------------------------------------
-# Map article IDs to HTML
-# -------------------------------------------------------------------
-id_to_html = {}
-metadata_files = sorted([f for f in os.listdir(metadata_dir) if f.endswith(".json")])
-for filename in metadata_files:
-    path = os.path.join(metadata_dir, filename)
-    with open(path, 'r', encoding='utf-8') as f:
-        meta = json.load(f)
-        article_id = int(meta.get("article_number"))
-        html_file = os.path.splitext(filename)[0] + ".html"
-        id_to_html[article_id] = html_file
-
-sorted_ids = sorted(id_to_html.keys())
+    return {
+        "styles": styles,
+        "site_name": site_name,
+        "copyright_text": copyright_text,
+        "templates": templates,
+        "rel_logo_path": rel_logo_path,
+        "top_links_html": top_links_html,
+        "local_css_name": "global.css",
+        "favicon_name": "favicon.ico",
+        "image_variants": image_variants,
+        "image_sizes": site.image_settings["sizes"],
+        "highlight": site.highlight_settings,
+        "highlight_css_html": highlight_css_link(site.highlight_settings),
+    }
 
 # -------------------------------------------------------------------
-# Helper functions
+# Build
 # -------------------------------------------------------------------
-def remove_first_h1(md_text):
-    pattern = r'^(#\s+.+)$'
-    match = re.search(pattern, md_text, re.MULTILINE)
-    if match:
-        return md_text.replace(match.group(1), '', 1).lstrip('\n'), match.group(1)[2:].strip()
-    else:
-        return md_text, ""
-
-def has_meaningful_content(html):
-    soup = BeautifulSoup(html, "html.parser")
-    for tag in soup.find_all():
-        if not tag.get_text(strip=True) and tag.name not in ['img', 'math']:
-            tag.decompose()
-    return bool(soup.get_text(strip=True) or soup.find(['img', 'math']))
-
-def prepend_image_path(match):
-    alt_text = match.group(1)
-    img_file = match.group(2)
-    if '/' not in img_file and '\\' not in img_file:
-        img_file = f"../Images/{img_file}"
-    return f"![{alt_text}]({img_file})"
-
-def rewrite_html_links(match):
-    text_l = match.group(1)
-    url = match.group(2)
-    if url.endswith(".html"):
-        url = "/" + url[:-5]
-    return f"[{text_l}]({url})"
-
-def load_fstring_template(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return f.read().strip()
+def build_articles(site, full=False, workers=1, only=None, force=False):
+    """Render changed drafts into Articles-html and Articles-md.
 
-# -------------------------------------------------------------------
-# Process Draft Markdown Files
-# -------------------------------------------------------------------
-draft_files = [f for f in os.listdir(drafts_dir) if f.endswith(".md")]
-
-for md_name in draft_files:
-    input_file = os.path.join(drafts_dir, md_name)
-    with open(input_file, 'r', encoding='utf-8') as f:
-        text = f.read()
-
-    is_article = "<not-article>" not in text
-    text = text.replace("<not-article>", "")
-    text = re.sub(r"<thumbnail:.*?>", "", text)
-
-    # Remove first H1
-    text, first_h1 = remove_first_h1(text)
-
-    # Fix image paths
-    text_for_html = re.sub(r'!\[([^\]]*)\]\(([^)]+)\)', prepend_image_path, text)
-
-    # Rewrite links
-    text_for_html = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', rewrite_html_links, text_for_html)
-
-    # Convert Markdown → HTML
-    html_body = markdown.markdown(
-        text_for_html,
-        extensions=['extra','smarty','toc','sane_lists','codehilite','md_in_html'],
-        extension_configs={
-            'smarty': {'smart_quotes': True, 'smart_dashes': True, 'smart_ellipses': True},
-            'codehilite': {'guess_lang': True, 'linenums': True, 'pygments_style': 'monokai', 'noclasses': True}
-        },
-        output_format="html5"
-    )
+    workers=0 uses one process per CPU core. only limits the build to
+    those draft filenames and force renders them even when unchanged.
+    Returns the md names that were rendered.
+    """
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
 
     # -------------------------------------------------------------------
-    # Precompute template variables
+    # Build manifest (incremental builds)
     # -------------------------------------------------------------------
-    article_h1_html = f'<h1 style="{TOP_H1_STYLE}">{first_h1}</h1>' if first_h1 else ""
-    article_date_html = ""
-    basename = os.path.splitext(md_name)[0]
-    metadata_path = os.path.join(metadata_dir, basename + ".json")
-
-    article_id = None
-    if os.path.exists(metadata_path):
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            meta = json.load(f)
-            article_id = int(meta.get("article_number"))  # <-- FIX: ensure int
-            date_created_iso = meta.get("date_created")
-            if date_created_iso:
-                dt = datetime.fromisoformat(date_created_iso)
-                formatted_date = dt.strftime("%d %B %Y, %H:%M")
-                article_date_html = f'<div style="font-size:0.9em; margin-bottom: 10px;">{formatted_date}</div>'
-
-    # Relative logo path
-    rel_logo_path = os.path.relpath(logo_path_full, articles_html_dir).replace("\\", "/")
+    for d in [site.articles_html_dir, site.articles_md_dir, site.fragments_dir]:
+        os.makedirs(d, exist_ok=True)
 
-    # Top links HTML
-    link_fstring = load_fstring_template(os.path.join(config_dir, "toplinksStyle.txt"))
-    top_links_html = " ".join([eval(link_fstring) for name, link in top_links])
+    if full:
+        for d in [site.articles_html_dir, site.articles_md_dir, site.fragments_dir]:
+            for filename in os.listdir(d):
+                file_path = os.path.join(d, filename)
+                if os.path.isfile(file_path) or os.path.islink(file_path):
+                    os.unlink(file_path)
+                elif os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+        manifest = empty_manifest()
+    else:
+        manifest = load_manifest(site.manifest_path)
 
-    # -------------------------------------------------------------------
-    # Previous / Next links
-    # -------------------------------------------------------------------
-    prev_link_html = ""
-    next_link_html = ""
-    if article_id in sorted_ids:
-        idx = sorted_ids.index(article_id)
-        if idx > 0:
-            prev_file = id_to_html[sorted_ids[idx - 1]]
-            prev_link_html = f'<a href="/{prev_file[:-5]}">Previous</a>'
-        if idx < len(sorted_ids) - 1:
-            next_file = id_to_html[sorted_ids[idx + 1]]
-            next_link_html = f'<a href="/{next_file[:-5]}">Next</a>'
+    article_records = manifest["articles"]
+    asset_hashes = manifest["assets"]
+    asset_stamps = manifest["stamps"]
 
     # -------------------------------------------------------------------
-    # Separator HTML
+    # Ensure favicon + Images (only copied when their hash changed)
     # -------------------------------------------------------------------
-    separatorStyle = load_fstring_template(os.path.join(config_dir, "separatorStyle.txt"))
-    separator_html = eval(separatorStyle) if has_meaningful_content(html_body) else ""
+    with stage("assets"):
+        favicon_target = os.path.join(site.articles_html_dir, "favicon.ico")
+        favicon_source = os.path.join(site.config_dir, "favicon.ico")
+        try:
+            sync_file(favicon_source, favicon_target, asset_hashes, "favicon.ico", asset_stamps)
+        except OSError as e:
+            print(f"Failed to copy favicon.ico: {e}")
+
+        images_src = site.images_dir
+        images_dst = os.path.join(site.articles_html_dir, "Images")
+        copied_images = sync_tree(images_src, images_dst, asset_hashes, "Images/", asset_stamps)
+        if copied_images:
+            print(f"Copied {copied_images} changed image(s) to Articles-html")
+
+        # Resized/WebP variants, reused from the image cache when the source hash is unchanged
+        image_hashes = {key[len("Images/"):]: digest for key, digest in asset_hashes.items() if key.startswith("Images/")}
+        image_variants = build_variants(images_src, site.root_dir, site.articles_html_dir, site.image_settings, image_hashes)
+        # Kept for homepage.py's thumbnails
+        manifest["images"] = image_variants
+
+        # Create output dirs
+        for d in [site.articles_html_dir, site.articles_md_dir, site.metadata_dir, site.site_html_dir]:
+            os.makedirs(d, exist_ok=True)
+
+        # -------------------------------------------------------------------
+        # Copy robots.txt and global.css if they changed
+        # -------------------------------------------------------------------
+        robots_src = os.path.join(site.config_dir, "robots.txt")
+        robots_dst = os.path.join(site.articles_html_dir, "robots.txt")
+        if os.path.exists(robots_src):
+            try:
+                if sync_file(robots_src, robots_dst, asset_hashes, "robots.txt", asset_stamps):
+                    print("Copied robots.txt to Articles-html")
+                    compress_file(robots_dst)
+                elif not os.path.exists(robots_dst + ".gz"):
+                    compress_file(robots_dst)
+            except Exception as e:
+                print(f"Failed to copy robots.txt: {e}")
+
+    with stage("config"):
+        shared = load_shared_config(site, image_variants)
+        # Workers time each article only when this build is being timed
+        shared["timings"] = active()
+        local_css_name = shared["local_css_name"]
+        local_css_path = os.path.join(site.articles_html_dir, local_css_name)
+        if sync_file(site.config_path("global.css"), local_css_path, asset_hashes, local_css_name, asset_stamps) or not os.path.exists(local_css_path + ".gz"):
+            compress_file(local_css_path)
+
+        # Pygments stylesheet for class-based code highlighting
+        highlight_css_path = os.path.join(site.articles_html_dir, HIGHLIGHT_CSS_NAME)
+        css = highlight_css(site.highlight_settings)
+        if css is not None:
+            if sync_bytes(css.encode("utf-8"), highlight_css_path, asset_hashes, HIGHLIGHT_CSS_NAME) or not os.path.exists(highlight_css_path + ".gz"):
+                compress_file(highlight_css_path)
+        elif asset_hashes.pop(HIGHLIGHT_CSS_NAME, None) is not None:
+            for path in [highlight_css_path] + compressed_siblings(highlight_css_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        # -------------------------------------------------------------------
+        # Hash every Config file and script a rendered page depends on
+        # -------------------------------------------------------------------
+        template_dependencies = [
+            os.path.abspath(__file__),
+            os.path.join(base_dir, "render.py"),
+            os.path.join(base_dir, "converter.py"),
+            os.path.join(base_dir, "compress.py"),
+            os.path.join(base_dir, "images.py"),
+            os.path.join(base_dir, "templates.py"),
+            site.config_path("name.txt"),
+            site.config_path("toplinks.txt"),
+            site.config_path("copyright.txt"),
+            site.config_path("topstyle.css"),
+            site.config_path("bottomstyle.css"),
+            site.config_path("highlight.json"),
+        ] + [os.path.join(site.config_dir, name + ".txt") for name in PAGE_TEMPLATES]
+        # Pages embed variant URLs, so a changed image invalidates them too
+        variants_digest = hash_bytes(json.dumps(image_variants, sort_keys=True).encode("utf-8"))
+        config_hash = hash_bytes((hash_files(template_dependencies) + variants_digest).encode("ascii"))
 
     # -------------------------------------------------------------------
-    # Load page templates
+    # Navigation graph (prev/next for every article, computed once)
     # -------------------------------------------------------------------
-    page_top_fstring = load_fstring_template(os.path.join(config_dir, "page_top.txt"))
-    page_top = eval(f"f'''{page_top_fstring}'''")
-
-    page_bottom_fstring = load_fstring_template(os.path.join(config_dir, "page_bottom.txt"))
-    page_bottom = eval(f"f'''{page_bottom_fstring}'''")
-
-    page_title     = first_h1 if first_h1 else site_name
-    local_css_name = "global.css"
-    page_full_fstring = load_fstring_template(os.path.join(config_dir, "page_full.txt"))
-    html_full = eval(f"f'''{page_full_fstring}'''")
+    with stage("navigation"):
+        metadata_index = load_index(site.root_dir)
+        navigation = build_navigation(metadata_index)
 
     # -------------------------------------------------------------------
-    # Copy CSS
+    # Process Draft Markdown Files
     # -------------------------------------------------------------------
-    local_css_path = os.path.join(articles_html_dir, local_css_name)
-    shutil.copy2(config_css_path, local_css_path)
+    with stage("scan"):
+        draft_files = sorted(f for f in os.listdir(site.drafts_dir) if f.endswith(".md"))
+        if only is not None:
+            draft_files = [f for f in draft_files if f in only]
+
+        # Remove outputs whose draft was deleted
+        deleted = set(article_records) - set(os.listdir(site.drafts_dir))
+        if only is not None:
+            deleted &= set(only)
+        for md_name in sorted(deleted):
+            for output in article_records.pop(md_name).get("outputs", []):
+                output_path = os.path.join(site.root_dir, output)
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            print(f"Removed outputs of deleted draft: {md_name}")
+
+        jobs = []
+        for md_name in draft_files:
+            input_file = os.path.join(site.drafts_dir, md_name)
+            with open(input_file, 'rb') as f:
+                raw = f.read()
+            basename = os.path.splitext(md_name)[0]
+
+            # -------------------------------------------------------------------
+            # Previous / Next links
+            # -------------------------------------------------------------------
+            meta = metadata_index.get(basename)
+            date_created_iso = meta.get("date_created") if meta is not None else None
+
+            prev_link_html = ""
+            next_link_html = ""
+            links = navigation["links"].get(basename)
+            if links:
+                if links["prev"]:
+                    prev_link_html = f'<a href="/{links["prev"]}">Previous</a>'
+                if links["next"]:
+                    next_link_html = f'<a href="/{links["next"]}">Next</a>'
+
+            # -------------------------------------------------------------------
+            # Skip drafts whose inputs are unchanged since the last build
+            # -------------------------------------------------------------------
+            html_path = os.path.join(site.articles_html_dir, basename + '.html')
+            md_out_path = os.path.join(site.articles_md_dir, md_name)
+            fragment_path = os.path.join(site.fragments_dir, basename + '.html')
+            inputs = {
+                "draft": hash_bytes(raw),
+                "metadata": hash_bytes(json.dumps(meta, sort_keys=True).encode("utf-8")) if meta is not None else None,
+                "config": config_hash,
+                "prev": prev_link_html,
+                "next": next_link_html,
+            }
+            record = article_records.get(md_name)
+            if not force and record and record.get("inputs") == inputs and all(os.path.exists(p) for p in [html_path, md_out_path, fragment_path]):
+                continue
+
+            jobs.append({
+                "md_name": md_name,
+                "input_file": input_file,
+                "text": raw.decode('utf-8'),
+                "date_created": date_created_iso,
+                "prev_link_html": prev_link_html,
+                "next_link_html": next_link_html,
+                "html_path": html_path,
+                "md_out_path": md_out_path,
+                "fragment_path": fragment_path,
+                "inputs": inputs,
+            })
 
     # -------------------------------------------------------------------
-    # Write HTML and Markdown
+    # Render (in-process, or across a process pool)
+    # Results come back in job order so logs and the manifest stay deterministic.
     # -------------------------------------------------------------------
-    html_path = os.path.join(articles_html_dir, basename + '.html')
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(html_full)
-
-    shutil.copy2(input_file, os.path.join(articles_md_dir, md_name))
+    with stage("render"):
+        if workers > 1 and len(jobs) > 1:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(shared,)) as pool:
+                results = list(pool.map(render_in_worker, jobs, chunksize=chunksize))
+        else:
+            results = [render_timed(job, shared) for job in jobs]
+
+    with stage("manifest"):
+        for job, (log_line, article_timings) in zip(jobs, results):
+            if article_timings is not None:
+                record_article(job["md_name"], article_timings)
+            outputs = []
+            for path in [job["html_path"], job["md_out_path"]]:
+                outputs += [path] + compressed_siblings(path)
+            outputs.append(job["fragment_path"])
+            article_records[job["md_name"]] = {
+                "inputs": job["inputs"],
+                "outputs": [os.path.relpath(path, site.root_dir).replace("\\", "/") for path in outputs],
+            }
+            # Debug / confirmation
+            print(log_line)
+
+        print(f"Rendered {len(jobs)} of {len(draft_files)} draft(s), {len(draft_files) - len(jobs)} unchanged.")
+        save_manifest(site.manifest_path, manifest)
+
+
+    source_404 = os.path.join(site.articles_html_dir, "404.html")
+
+    if os.path.isfile(source_404):
+        print("404.html found in Articles-html.")
+
+        # --- 2. Copy to Articles-md ---
+        dest_404 = os.path.join(site.articles_md_dir, "404.html")
+
+        # Ensure destination directory exists
+        os.makedirs(site.articles_md_dir, exist_ok=True)
+
+        shutil.copy2(source_404, dest_404)
+        print(f"Copied 404.html to: {dest_404}")
 
-    # Debug / confirmation
-    print(f"Article: {basename}, Prev: {prev_link_html}, Next: {next_link_html}")
-
-
-source_404 = os.path.join(articles_html_dir, "404.html")
-
-if os.path.isfile(source_404):
-    print("404.html found in Articles-html.")
-
-    # --- 2. Copy to Articles-md ---
-    dest_404 = os.path.join(articles_md_dir, "404.html")
-
-    # Ensure destination directory exists
-    os.makedirs(articles_md_dir, exist_ok=True)
-
-    shutil.copy2(source_404, dest_404)
-    print(f"Copied 404.html to: {dest_404}")
-
-else:
-    print("404.html NOT found in Articles-html.")
-
-# -------------------------------------------------------------------
-# Run feeds and server
-# -------------------------------------------------------------------
-try:
-    subprocess.run(["python3", feeds_script], check=True)
-except subprocess.CalledProcessError as e:
-    print(f"Error running feed generator: {e}")
+    else:
+        print("404.html NOT found in Articles-html.")
+
+    return [job["md_name"] for job in jobs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Drafts into Articles-html and Articles-md.")
+    parser.add_argument("--full", action="store_true", help="ignore the build manifest and rebuild every output")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of render processes (0 = one per CPU core, default 1 = no pool)")
+    parser.add_argument("--timings", action="store_true",
+                        help="print wall/CPU time per build stage and the slowest articles")
+    parser.add_argument("--timings-json", metavar="PATH", help="also write the timings to PATH as JSON")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="write cProfile stats to PATH (main process only; use -j 1 to include rendering)")
+    args = parser.parse_args()
+
+    from contextlib import nullcontext
+    from raven import Site
+    from timing import collecting
+
+    timed = args.timings or args.timings_json
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    with (collecting() if timed else nullcontext()) as timings:
+        if profiler:
+            profiler.enable()
+        try:
+            Site().build_all(full=args.full, workers=args.workers)
+        finally:
+            if profiler:
+                profiler.disable()
+
+    if timed:
+        print(timings.summary())
+    if args.timings_json:
+        timings.write_json(args.timings_json)
+        print(f"Wrote timings to {args.timings_json}")
+    if profiler:
+        import pstats
+        profiler.dump_stats(args.profile)
+        print(f"Wrote profile to {args.profile} (inspect with: python3 -m pstats {args.profile})")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import os
+import time
+
+from manifest import bump_generation
+from metaindex import load_index
+from navigation import build_navigation
+from raven import Site
+
+# -------------------------------------------------------------------
+# Watch mode
+#
+#   python3 watch.py [--interval 0.5] [--debounce 0.3]
+#
+# Polls Drafts, Config, Images and Articles-Metadata and rebuilds after
+# each burst of saves has settled:
+#
+#   - edited/added/removed drafts: only those articles plus their old
+#     and new Previous/Next neighbours
+#   - metadata: the articles whose metadata changed plus neighbours
+#   - Config or Images: config is reloaded and every page whose inputs
+#     changed is rebuilt (the manifest skips the rest)
+#
+# Feeds and the homepage follow; both skip writing when nothing they
+# show changed. Every rebuild bumps the build generation, which
+# server.py uses to drop its cache and, with live_reload on in
+# Config/server.json, to reload open pages.
+#
+# One Site is kept for the whole session, so imports, templates and
+# the markdown converter are warm for every rebuild.
+# -------------------------------------------------------------------
+WATCHED_DIRS = ["Drafts", "Config", "Images", "Articles-Metadata"]
+
+
+def snapshot(site):
+    """{relative path: (mtime_ns, size)} for every watched file."""
+    files = {}
+    for name in WATCHED_DIRS:
+        top = os.path.join(site.root_dir, name)
+        for dirpath, _, filenames in os.walk(top):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                rel = os.path.relpath(path, site.root_dir).replace("\\", "/")
+                files[rel] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def changed_paths(before, after):
+    return sorted(path for path in set(before) | set(after) if before.get(path) != after.get(path))
+
+
+def neighbours(navigation, slugs):
+    """slugs plus their Previous/Next articles in navigation."""
+    found = set(slugs)
+    for slug in slugs:
+        links = navigation["links"].get(slug)
+        if links:
+            found.update(s for s in (links["prev"], links["next"]) if s)
+    return found
+
+
+def rebuild(site, paths, navigation):
+    """Rebuild what paths affect. Returns the new navigation graph."""
+    top_dirs = {path.split("/", 1)[0] for path in paths}
+    slugs = set()
+    for path in paths:
+        top, _, name = path.partition("/")
+        if top == "Drafts" and name.endswith(".md"):
+            slugs.add(name[:-len(".md")])
+        elif top == "Articles-Metadata" and name.endswith(".json"):
+            slugs.add(name[:-len(".json")])
+
+    if "Config" in top_dirs:
+        site.reload()
+
+    new_navigation = build_navigation(load_index(site.root_dir))
+    if top_dirs & {"Config", "Images"}:
+        rendered = site.build_articles()
+    else:
+        affected = neighbours(navigation, slugs) | neighbours(new_navigation, slugs)
+        rendered = site.build_articles(only=[slug + ".md" for slug in sorted(affected)])
+
+    site.build_feeds()
+    site.build_homepage()
+    bump_generation(site.root_dir)
+    print(f"Rebuilt {len(rendered)} article(s) for {len(paths)} change(s)")
+    return new_navigation
+
+
+def watch(site, interval=0.5, debounce=0.3):
+    print("Initial build...")
+    site.build_all()
+    navigation = build_navigation(load_index(site.root_dir))
+    files = snapshot(site)
+    print(f"Watching {', '.join(WATCHED_DIRS)} (Ctrl+C to stop)")
+
+    pending = set()
+    last_change = 0.0
+    failed = False
+    while True:
+        time.sleep(interval)
+        current = snapshot(site)
+        changes = changed_paths(files, current)
+        files = current
+        if changes:
+            pending.update(changes)
+            last_change = time.monotonic()
+            failed = False
+            continue
+        # Wait for a quiet period so a burst of saves becomes one rebuild;
+        # after a failure, wait for the next change before trying again
+        if pending and not failed and time.monotonic() - last_change >= debounce:
+            paths = sorted(pending)
+            pending.clear()
+            started = time.perf_counter()
+            try:
+                navigation = rebuild(site, paths, navigation)
+            except Exception as e:
+                print(f"Rebuild failed: {e!r}")
+                # Keep the paths so the next rebuild still covers them
+                pending.update(paths)
+                failed = True
+                continue
+            print(f"Done in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the site as Drafts, Config, Images and metadata change.")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between polls (default 0.5)")
+    parser.add_argument("--debounce", type=float, default=0.3,
+                        help="quiet seconds after the last change before rebuilding (default 0.3)")
+    args = parser.parse_args()
+    try:
+        watch(Site(), interval=args.interval, debounce=args.debounce)
+    except KeyboardInterrupt:
+        pass